@@ -0,0 +1,151 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Move generation and shortest path distances for many boards at once.
+
+Boards are given as an N x 8 x 8 array of EMPTY, FRIENDLY and ENEMY
+values, indexed [board, col, row] just like Board.squares, along with the
+name of the piece and its (col, row) origin on each board.  Every board
+is expanded a whole move at a time with array operations, so the
+interpreter overhead is paid once per move for the batch rather than once
+per square per board.
+"""
+from __future__ import absolute_import
+
+import numpy as np
+
+import tasks
+
+UNREACHABLE = -1
+
+
+def shift(squares, dc, dr):
+    # move every square dc columns and dr rows, dropping anything that
+    # falls off the board
+    shifted = np.zeros_like(squares)
+    cols = slice(max(dc, 0), 8 + min(dc, 0))
+    rows = slice(max(dr, 0), 8 + min(dr, 0))
+    from_cols = slice(max(-dc, 0), 8 + min(-dc, 0))
+    from_rows = slice(max(-dr, 0), 8 + min(-dr, 0))
+    shifted[:, cols, rows] = squares[:, from_cols, from_rows]
+    return shifted
+
+
+def slide(frontier, enemies, directions):
+    # every square a sliding piece reaches in one move from the frontier.
+    # A ray stops after the first enemy it meets.
+    reached = np.zeros_like(frontier)
+    for direction in directions:
+        dc, dr = tasks.STEPS[direction]
+        ray = frontier
+        for _ in range(7):
+            ray = shift(ray, dc, dr)
+            if not ray.any():
+                break
+            reached |= ray
+            ray = ray & ~enemies
+    return reached
+
+
+def jump(frontier, jumps):
+    reached = np.zeros_like(frontier)
+    for dc, dr in jumps:
+        reached |= shift(frontier, dc, dr)
+    return reached
+
+
+def push_and_capture(frontier, enemies, occupied):
+    # pawns capture diagonally forward, and push one square forward or
+    # two from their starting row if nothing is in the way
+    reached = (shift(frontier, 1, 1) | shift(frontier, -1, 1)) & enemies
+    push = shift(frontier, 0, 1) & ~occupied
+    reached |= push
+    reached[:, :, 3] |= push[:, :, 2] & ~occupied[:, :, 3]
+    return reached
+
+
+def expand(piece, frontier, enemies, occupied):
+    if piece in tasks.SLIDING_DIRECTIONS:
+        return slide(frontier, enemies, tasks.SLIDING_DIRECTIONS[piece])
+    elif piece == tasks.KNIGHT:
+        return jump(frontier, tasks.KNIGHT_JUMPS)
+    elif piece == tasks.KING:
+        return jump(frontier, [tasks.STEPS[d]
+                               for d in tasks.KING_DIRECTIONS])
+    elif piece == tasks.PAWN:
+        return push_and_capture(frontier, enemies, occupied)
+    return np.zeros_like(frontier)
+
+
+def get_origins(origins, count):
+    origins = np.asarray(origins, dtype=np.intp).reshape(count, 2)
+    frontier = np.zeros((count, 8, 8), dtype=bool)
+    frontier[np.arange(count), origins[:, 0], origins[:, 1]] = True
+    return origins, frontier
+
+
+def check_pawns(pieces, origins):
+    if ((pieces == tasks.PAWN) & (origins[:, 1] == 0)).any():
+        msg = 'This is not a valid position for a pawn.'
+        raise tasks.IllegalPositionError(msg)
+
+
+def get_available_moves(pieces, origins, occupancy):
+    """
+    Returns an N x 8 x 8 boolean array of the squares each piece can move
+    to from its origin.
+    """
+    occupancy = np.asarray(occupancy)
+    pieces = np.asarray(pieces)
+    origins, frontier = get_origins(origins, len(occupancy))
+    check_pawns(pieces, origins)
+    enemies = occupancy == tasks.ENEMY
+    occupied = occupancy != tasks.EMPTY
+    moves = np.zeros_like(frontier)
+    for piece in np.unique(pieces):
+        group = pieces == piece
+        moves[group] = expand(piece, frontier[group], enemies[group],
+                              occupied[group])
+    return moves
+
+
+def get_distances(pieces, origins, occupancy):
+    """
+    Returns an N x 8 x 8 array with the fewest moves needed to reach each
+    square from the piece's origin, or UNREACHABLE.
+    """
+    occupancy = np.asarray(occupancy)
+    pieces = np.asarray(pieces)
+    origins, frontier = get_origins(origins, len(occupancy))
+    check_pawns(pieces, origins)
+    distances = np.full(frontier.shape, UNREACHABLE, dtype=np.int8)
+    distances[frontier] = 0
+    for piece in np.unique(pieces):
+        group = pieces == piece
+        enemies = occupancy[group] == tasks.ENEMY
+        occupied = occupancy[group] != tasks.EMPTY
+        reached = frontier[group]
+        visited = reached.copy()
+        group_distances = distances[group]
+        depth = 0
+        while reached.any():
+            depth += 1
+            reached = expand(piece, reached, enemies, occupied) & ~visited
+            visited |= reached
+            group_distances[reached] = depth
+        distances[group] = group_distances
+    return distances
+
+
+def to_occupancy(boards):
+    """
+    Stacks the squares of Board objects into an occupancy array.
+    """
+    return np.array([[list(column) for column in board.squares]
+                     for board in boards], dtype=np.uint8)
@@ -0,0 +1,249 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Benchmarks for move generation, shortest paths, the farthest target and
+the collect tour.  Enemy layouts come from a seeded random generator, so
+every run times the same work and results can be saved as a baseline
+and compared against later runs, e.g.
+
+    python bench.py --save baseline.json
+    python bench.py --compare baseline.json
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import os
+import random
+import sys
+from collections import OrderedDict
+from timeit import default_timer
+
+import tasks
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2 only has the peak for the whole process, see run_isolated
+    import resource
+    tracemalloc = None
+
+PIECES = [tasks.PAWN, tasks.ROOK, tasks.KNIGHT,
+          tasks.BISHOP, tasks.QUEEN, tasks.KING]
+# collect is only allowed for pieces that can reach every square
+COLLECT_PIECES = [tasks.ROOK, tasks.KNIGHT, tasks.QUEEN, tasks.KING]
+
+
+def get_layouts(rng, count, pieces, enemies=8):
+    # boards with the piece and its enemies on distinct random squares
+    boards = []
+    for idx in range(count):
+        piece = pieces[idx % len(pieces)]
+        # pawns can't start on the first row
+        origin = rng.randrange(8 if piece == tasks.PAWN else 0, 64)
+        squares = rng.sample([sq for sq in range(64) if sq != origin],
+                             enemies)
+        boards.append(tasks.Board(
+            piece, tasks.to_algebraic(*tasks.SQUARES[origin]),
+            enemies=[tasks.to_algebraic(*tasks.SQUARES[sq])
+                     for sq in squares]))
+    return boards
+
+
+def bench_moves(piece):
+    def prepare(rng, count):
+        calls = []
+        for board in get_layouts(rng, count, [piece]):
+            for col, row in tasks.SQUARES:
+                if piece != tasks.PAWN or row:
+                    calls.append((board._get_available_moves,
+                                  (piece, col, row)))
+        return calls
+    return prepare
+
+
+def bench_shortest_path(nearest):
+    def prepare(rng, count):
+        calls = []
+        for board in get_layouts(rng, count, COLLECT_PIECES):
+            origin = board.col, board.row
+            distances, _ = board.get_distance_map(origin)
+            targets = sorted((distances[t], t) for t in board.targets
+                             if t in distances)
+            target = targets[0 if nearest else -1][1]
+            calls.append((board.get_shortest_path, (origin, target)))
+        return calls
+    return prepare
+
+
+def bench_farthest_target(rng, count):
+    return [(board.get_farthest_target, ())
+            for board in get_layouts(rng, count, PIECES)]
+
+
+def bench_collect(exact):
+    def prepare(rng, count):
+        return [(board.get_fewest_moves_to_all_targets, (exact,))
+                for board in get_layouts(rng, count, COLLECT_PIECES)]
+    return prepare
+
+
+def bench_collect_improved(rng, count):
+    return [(board.get_fewest_moves_to_all_targets, (False, True))
+            for board in get_layouts(rng, count, COLLECT_PIECES, enemies=40)]
+
+
+BENCHMARKS = OrderedDict(
+    [('moves_' + piece.lower(), bench_moves(piece)) for piece in PIECES] +
+    [('shortest_path_near', bench_shortest_path(True)),
+     ('shortest_path_far', bench_shortest_path(False)),
+     ('farthest_target', bench_farthest_target),
+     ('collect_greedy', bench_collect(False)),
+     ('collect_exact', bench_collect(True)),
+     ('collect_improved', bench_collect_improved)])
+
+
+def percentile(times, fraction):
+    # nearest rank percentile of sorted times
+    idx = int(round(fraction * (len(times) - 1)))
+    return times[idx]
+
+
+def run_benchmark(prepare, seed=0, count=20, repeat=3):
+    """
+    Times every call prepare makes for count boards, repeat times over.
+    Boards are set up again for each repeat so caches on them start
+    cold, but the layouts are the same every time.
+    """
+    times = []
+    if tracemalloc:
+        tracemalloc.start()
+    else:
+        start_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    for _ in range(repeat):
+        tasks.MOVE_CACHE.clear()
+        tasks.TRANSPOSITIONS.clear()
+        calls = prepare(random.Random(seed), count)
+        for func, args in calls:
+            start = default_timer()
+            func(*args)
+            times.append(default_timer() - start)
+    if tracemalloc:
+        peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    else:
+        # how far the benchmark raised the process's peak
+        peak = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss -
+                start_kb)
+    times.sort()
+    return OrderedDict([
+        ('ops', len(times)),
+        ('ops_per_sec', len(times) / sum(times)),
+        ('p50_us', percentile(times, 0.5) * 1e6),
+        ('p90_us', percentile(times, 0.9) * 1e6),
+        ('p99_us', percentile(times, 0.99) * 1e6),
+        ('peak_kb', peak)])
+
+
+def run_isolated(prepare, seed=0, count=20, repeat=3):
+    # run_benchmark in a child process.  Without tracemalloc the peak
+    # memory is the process's, and a benchmark could only raise the peak
+    # left by the hungriest one before it.  A child starts from the
+    # memory in use when it's forked, so its peak is its own.
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if not pid:
+        status = 1
+        try:
+            os.close(read_fd)
+            result = run_benchmark(prepare, seed, count, repeat)
+            with os.fdopen(write_fd, 'w') as fd:
+                json.dump(result, fd)
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as fd:
+        output = fd.read()
+    _, status = os.waitpid(pid, 0)
+    if status:
+        raise RuntimeError('The benchmark failed.')
+    return json.loads(output, object_pairs_hook=OrderedDict)
+
+
+def run_benchmarks(names=None, seed=0, count=20, repeat=3):
+    run = run_benchmark
+    if not tracemalloc and hasattr(os, 'fork'):
+        run = run_isolated
+    results = OrderedDict()
+    for name in names or BENCHMARKS:
+        results[name] = run(BENCHMARKS[name], seed, count, repeat)
+    return results
+
+
+def compare(results, baseline, threshold=0.1):
+    """
+    Returns the names of benchmarks whose median time is more than
+    threshold slower than in the baseline.
+    """
+    return [name for name, result in results.items()
+            if name in baseline and
+            result['p50_us'] > baseline[name]['p50_us'] * (1 + threshold)]
+
+
+def report(results, baseline=None):
+    lines = ['{:<20} {:>12} {:>10} {:>10} {:>10} {:>9}'.format(
+        'benchmark', 'ops/sec', 'p50 us', 'p90 us', 'p99 us', 'peak kb')]
+    for name, result in results.items():
+        line = '{:<20} {ops_per_sec:>12.1f} {p50_us:>10.1f} {p90_us:>10.1f} '
+        line += '{p99_us:>10.1f} {peak_kb:>9}'
+        line = line.format(name, **result)
+        if baseline and name in baseline:
+            line += ' {:>+7.1%}'.format(
+                result['p50_us'] / baseline[name]['p50_us'] - 1)
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmarks', nargs='*',
+                        help=('benchmarks to run, all of them by default: '
+                              '{}'.format(', '.join(BENCHMARKS))))
+    parser.add_argument('--seed', help='seed for the enemy layouts',
+                        type=int, default=0)
+    parser.add_argument('--count', help='number of boards per benchmark',
+                        type=int, default=20)
+    parser.add_argument('--repeat', help='number of times to time them',
+                        type=int, default=3)
+    parser.add_argument('--save', help='save the results to this file')
+    parser.add_argument('--compare',
+                        help='compare the results with a saved baseline')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help=('fraction a median may slow down by before '
+                              'it counts as a regression'))
+    args = parser.parse_args()
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: {}'.format(', '.join(unknown)))
+    results = run_benchmarks(args.benchmarks, args.seed, args.count,
+                             args.repeat)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as fd:
+            baseline = json.load(fd)
+    print report(results, baseline)
+    if args.save:
+        with open(args.save, 'w') as fd:
+            json.dump(results, fd, indent=2)
+    if baseline:
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print 'regressions: {}'.format(', '.join(regressions))
+            sys.exit(1)
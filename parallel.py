@@ -0,0 +1,63 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Answers many board queries across a pool of worker processes.
+
+Each query is a tuple of arguments for tasks.solve, e.g.
+(tasks.COLLECT, tasks.QUEEN, 'h2', ['g4', 'h5']).  Queries are handed to
+the workers in chunks, and results stream back as (index, result) pairs
+either in the order the queries were given or as soon as they're ready.
+Given a store, the workers share answers through a store.SolutionStore
+file, which also keeps them for later runs.
+"""
+from __future__ import absolute_import
+
+import multiprocessing
+
+import store
+import tasks
+
+# each worker's cache of answers backed by the store, if there is one
+cache = None
+
+
+def warm_up(store_path=None, store_size=store.MAX_ENTRIES):
+    # run once in every worker before it takes any queries, so the
+    # lookup tables are built and the search code is exercised up front
+    global cache
+    if store_path:
+        cache = tasks.SymmetryCache(results=store.SolutionStore(
+            store_path, store_size))
+    tasks.solve(tasks.MOVES, tasks.QUEEN, 'a1')
+
+
+def solve(indexed_query):
+    index, query = indexed_query
+    return index, tasks.solve(*query, cache=cache)
+
+
+def run_queries(queries, processes=None, chunksize=64, ordered=True,
+                store_path=None, store_size=store.MAX_ENTRIES):
+    """
+    Yields an (index, result) pair for every query.  processes defaults
+    to the number of cores.  With ordered=False results are yielded as
+    soon as they're done, which keeps every worker busy when some queries
+    take much longer than others.  With a store_path answers are looked
+    up in and added to the store there, which keeps store_size of them.
+    """
+    pool = multiprocessing.Pool(processes, initializer=warm_up,
+                                initargs=(store_path, store_size))
+    try:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for result in imap(solve, enumerate(queries), chunksize):
+            yield result
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
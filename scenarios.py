@@ -0,0 +1,232 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Seeded random enemy layouts, made many thousands at a time for load tests.
+
+A scenario is the square of the piece and the squares of its enemies,
+numbered row * width + col just like Board's bitboards.  generate makes
+them with array operations a chunk at a time, so millions of them cost
+seconds rather than minutes, and the same seed always gives the same
+scenarios.  With reachable=True the first enemy of every scenario is one
+the piece can get to, so no query has to set the enemies up again:
+
+    bishops have one on their own colour
+    pawns have one diagonally ahead of a clear run up their column
+    knights have one a jump away on boards too small to reach every square
+    everything else can reach every square anyway
+
+to_bitboards packs 8x8 scenarios into enemy and occupied bitboards, and
+iter_boards turns scenarios of any size into Board objects.
+"""
+from __future__ import absolute_import
+
+import numpy as np
+
+import tasks
+
+# random numbers drawn per chunk of scenarios, to bound the memory used
+CHUNK_KEYS = 1 << 22
+# boards up to this area pick their enemies by sorting random keys for
+# every square, bigger ones draw squares and redraw the rare collisions
+DENSE_AREA = 4096
+
+
+def knight_reaches_everything(width, height):
+    # the knight's graph is connected on every board at least 3x3 but
+    # 3x3 itself, whose middle square has no jumps
+    return min(width, height) >= 3 and (width, height) != (3, 3)
+
+
+def get_jumps(cols, rows, width, height):
+    # the square numbers of a knight's jumps from each square, and
+    # whether each jump lands on the board
+    jumps = np.array(tasks.KNIGHT_JUMPS)
+    to_cols = cols[:, None] + jumps[:, 0]
+    to_rows = rows[:, None] + jumps[:, 1]
+    valid = ((to_cols >= 0) & (to_cols < width) &
+             (to_rows >= 0) & (to_rows < height))
+    return to_rows * width + to_cols, valid
+
+
+def get_origin_squares(piece, width, height, reachable):
+    # the squares the piece may start on
+    area = width * height
+    cols, rows = np.arange(area) % width, np.arange(area) // width
+    allowed = np.ones(area, dtype=bool)
+    if piece == tasks.PAWN:
+        allowed &= rows > 0
+        if reachable:
+            # a pawn needs a row to move up to and a column to capture in
+            allowed &= (rows < height - 1) & (width > 1)
+    elif reachable and piece == tasks.BISHOP:
+        allowed &= width > 1 and height > 1
+    elif reachable and piece == tasks.KNIGHT:
+        allowed &= get_jumps(cols, rows, width, height)[1].any(axis=1)
+    elif reachable:
+        allowed &= area > 1
+    squares = np.flatnonzero(allowed)
+    if not len(squares):
+        raise ValueError('No square suits a {} on a {}x{} board.'.format(
+            piece, width, height))
+    return squares
+
+
+def get_targets(rng, piece, origins, width, height):
+    # a square the piece can reach from each origin, and for pawns the
+    # last row of the run up to it, which other enemies must keep clear of
+    count, area = len(origins), width * height
+    cols, rows = origins % width, origins // width
+    lane_end = rows
+    if piece == tasks.PAWN:
+        # push up the column to the row below the target, then capture
+        to_rows = rows + 1 + (rng.random_sample(count) *
+                              (height - 1 - rows)).astype(np.intp)
+        sides = np.where(rng.random_sample(count) < 0.5, -1, 1)
+        sides[cols == 0] = 1
+        sides[cols == width - 1] = -1
+        return to_rows * width + cols + sides, to_rows - 1
+    if piece == tasks.KNIGHT and not knight_reaches_everything(width,
+                                                                height):
+        jumps, valid = get_jumps(cols, rows, width, height)
+        keys = np.where(valid, rng.random_sample(valid.shape), 2.0)
+        return jumps[np.arange(count), keys.argmin(axis=1)], lane_end
+    targets = rng.randint(area, size=count)
+    while True:
+        bad = targets == origins
+        if piece == tasks.BISHOP:
+            # only squares of the bishop's own colour
+            bad |= ((targets % width + targets // width) % 2 !=
+                    (cols + rows) % 2)
+        if not bad.any():
+            return targets, lane_end
+        targets[bad] = rng.randint(area, size=bad.sum())
+
+
+def get_forbidden(origins, targets, lane_end, width):
+    # whether each of a scenario's squares must be left free of other
+    # enemies: the piece, its target and a pawn's run up to the target
+    cols, rows = origins[:, None] % width, origins[:, None] // width
+    taken = [origins[:, None]]
+    if targets is not None:
+        taken.append(targets[:, None])
+    lane_end = lane_end[:, None]
+
+    def forbidden(squares):
+        bad = squares == taken[0]
+        for squares_taken in taken[1:]:
+            bad |= squares == squares_taken
+        on_lane = squares // width
+        return bad | ((squares % width == cols) & (on_lane > rows) &
+                      (on_lane <= lane_end))
+    return forbidden
+
+
+def is_dense(area, enemy_count):
+    # whether drawing squares would collide too often to redraw them
+    return area <= DENSE_AREA or enemy_count * enemy_count > area
+
+
+def get_enemies(rng, count, area, enemy_count, forbidden):
+    # enemy_count distinct squares for each of count scenarios, none of
+    # them forbidden
+    if not enemy_count:
+        return np.zeros((count, 0), dtype=np.intp)
+    if is_dense(area, enemy_count):
+        keys = rng.random_sample((count, area))
+        keys[forbidden(np.arange(area)[None, :])] = 2.0
+        enemies = np.argpartition(keys, enemy_count - 1,
+                                  axis=1)[:, :enemy_count]
+        if (keys[np.arange(count)[:, None], enemies] > 1.0).any():
+            raise ValueError('Too many enemies to fit on the board.')
+        return enemies
+    enemies = rng.randint(area, size=(count, enemy_count))
+    while True:
+        ordered = np.sort(enemies, axis=1)
+        bad = ((ordered[:, 1:] == ordered[:, :-1]).any(axis=1) |
+               forbidden(enemies).any(axis=1))
+        if not bad.any():
+            return enemies
+        enemies[bad] = rng.randint(area, size=(bad.sum(), enemy_count))
+
+
+def generate(piece, count, enemy_count=None, seed=None, width=8, height=8,
+             reachable=False):
+    """
+    Returns count scenarios for the piece as an array of the square it
+    starts on and a count x enemy_count array of its enemies' squares.
+    enemy_count defaults to the same number Board places.  With
+    reachable=True the first enemy in every row is one the piece can
+    reach.
+    """
+    if not (0 < width <= tasks.MAX_BOARD_SIZE and
+            0 < height <= tasks.MAX_BOARD_SIZE):
+        raise ValueError('Boards can be from 1x1 to {0}x{0}.'.format(
+            tasks.MAX_BOARD_SIZE))
+    area = width * height
+    if enemy_count is None:
+        enemy_count = min(tasks.ENEMY_COUNT, area - 1)
+    elif not reachable <= enemy_count <= area - 1:
+        raise ValueError('From {} to {} enemies fit on the board.'.format(
+            int(reachable), area - 1))
+    rng = np.random.RandomState(seed)
+    squares = get_origin_squares(piece, width, height, reachable)
+    keys = area if is_dense(area, enemy_count) else max(1, enemy_count)
+    chunk = max(1, CHUNK_KEYS // keys)
+    all_origins, all_enemies = [], []
+    for start in range(0, count, chunk):
+        size = min(chunk, count - start)
+        origins = squares[rng.randint(len(squares), size=size)]
+        targets = None
+        lane_end = origins // width
+        if reachable:
+            targets, lane_end = get_targets(rng, piece, origins, width,
+                                            height)
+        forbidden = get_forbidden(origins, targets, lane_end, width)
+        enemies = get_enemies(rng, size, area,
+                              enemy_count - (targets is not None),
+                              forbidden)
+        if targets is not None:
+            enemies = np.hstack([targets[:, None], enemies])
+        all_origins.append(origins)
+        all_enemies.append(enemies)
+    if not all_origins:
+        return (np.zeros(0, dtype=np.intp),
+                np.zeros((0, enemy_count), dtype=np.intp))
+    return np.concatenate(all_origins), np.concatenate(all_enemies)
+
+
+def to_bitboards(origins, enemies):
+    """
+    Packs 8x8 scenarios into two arrays of 64 bit bitboards, the enemies
+    and every occupied square, as held by Board.
+    """
+    one = np.uint64(1)
+    enemy_bits = np.bitwise_or.reduce(
+        np.left_shift(one, np.asarray(enemies, dtype=np.uint64)), axis=1)
+    occupied_bits = enemy_bits | np.left_shift(
+        one, np.asarray(origins, dtype=np.uint64))
+    return enemy_bits, occupied_bits
+
+
+def iter_boards(piece, origins, enemies, width=8, height=8,
+                search=tasks.BFS):
+    """
+    Yields a Board for every scenario.
+    """
+    if (width, height) == (8, 8):
+        for origin, bits in zip(origins, to_bitboards(origins, enemies)[0]):
+            yield tasks.Board.from_bits(piece, int(origin), int(bits),
+                                        search=search)
+        return
+    for origin, squares in zip(origins, enemies):
+        bits = 0
+        for sq in squares:
+            bits |= 1 << int(sq)
+        yield tasks.Board.from_bits(piece, int(origin), bits, width, height,
+                                    search)
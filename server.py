@@ -0,0 +1,162 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+A long running server that answers board queries over a local socket, so
+callers don't pay for starting python and building the lookup tables on
+every query.
+
+Requests and responses are JSON objects, one per line.  A request holds
+the arguments for tasks.solve:
+
+    {"id": 1, "query": "collect", "piece": "QUEEN", "position": "h2",
+     "enemies": ["g4", "h5"], "exact": true}
+
+and the response echoes the id with either a "result" or an "error".
+Clients may pipeline as many requests as they like before reading;
+responses on a connection come back in request order.  Each connection is
+served by its own thread, so many clients are answered concurrently.
+With a cache, boards that are turned or mirrored copies of each other
+share their answers, see tasks.SymmetryCache, and with a store the
+answers are kept on disk for later runs and other servers, see
+store.SolutionStore.
+"""
+from __future__ import absolute_import
+
+import argparse
+import json
+import socket
+
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+import store
+import tasks
+
+HOST = '127.0.0.1'
+PORT = 8642
+# the arguments of tasks.solve, in order, that a request can hold
+ARGUMENTS = ('query', 'piece', 'position', 'enemies', 'exact', 'width',
+             'height', 'enemy_count', 'improve', 'time_limit')
+
+
+class QueryHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        # every line gets a response, an error if it can't be answered, so
+        # a bad request never ends the connection.  Bytes that aren't
+        # UTF-8 are replaced, leaving a line that isn't a valid request.
+        lines = (line.decode('utf-8', 'replace')
+                 for line in iter(self.rfile.readline, b''))
+        for response in tasks.answer_lines(lines, self.server.cache):
+            self.wfile.write(response.encode('utf-8'))
+            self.wfile.flush()
+
+
+class QueryServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    cache = None
+
+
+def make_server(host=HOST, port=PORT, cache_size=0, store_path=None):
+    """
+    Returns a server listening on host and port, ready for
+    serve_forever().  Port 0 picks a free port, see server_address.
+    With a cache_size the server keeps that many answers, in the file at
+    store_path if there is one.
+    """
+    # build the lookup tables and exercise the search before the first
+    # caller is waiting on them
+    tasks.solve(tasks.MOVES, tasks.QUEEN, 'a1')
+    server = QueryServer((host, port), QueryHandler)
+    if store_path:
+        server.cache = tasks.SymmetryCache(results=store.SolutionStore(
+            store_path, cache_size or store.MAX_ENTRIES))
+    elif cache_size:
+        server.cache = tasks.SymmetryCache(cache_size)
+    return server
+
+
+def make_request(args):
+    # a request for a query given as a tuple or dict of solve's arguments.
+    # Arguments that are left out take solve's defaults.
+    if isinstance(args, dict):
+        request = dict(args)
+    elif len(args) > len(ARGUMENTS):
+        raise TypeError('A query takes at most {} arguments ({} given).'
+                        .format(len(ARGUMENTS), len(args)))
+    else:
+        request = dict(zip(ARGUMENTS, args))
+    unknown = set(request) - set(ARGUMENTS)
+    if unknown:
+        raise TypeError('Unknown arguments: {}.'.format(
+            ', '.join(sorted(unknown))))
+    return request
+
+
+class Client(object):
+    """
+    Sends queries to a running server over one connection.
+    """
+
+    def __init__(self, host=HOST, port=PORT):
+        self.sock = socket.create_connection((host, port))
+        self.rfile = self.sock.makefile('rb')
+        self.next_id = 0
+
+    def query(self, query, piece, position, *args, **kwargs):
+        """
+        Sends one query, given as solve's arguments but for the cache, and
+        returns its response.
+        """
+        request = make_request((query, piece, position) + args)
+        for name in kwargs:
+            if name in request:
+                raise TypeError('{} is given twice.'.format(name))
+        request.update(kwargs)
+        return self.pipeline([request])[0]
+
+    def pipeline(self, queries):
+        """
+        Sends every query before reading any of the responses.  A query is
+        either a tuple of solve's arguments in order, or a dict of them by
+        name, leaving out the cache.  Returns the responses in the same
+        order.
+        """
+        lines = []
+        for args in queries:
+            request = make_request(args)
+            request['id'] = self.next_id
+            self.next_id += 1
+            lines.append(json.dumps(request).encode('utf-8') + b'\n')
+        self.sock.sendall(b''.join(lines))
+        return [json.loads(self.rfile.readline().decode('utf-8'))
+                for _ in lines]
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', help='address to listen on', default=HOST)
+    parser.add_argument('--port', help='port to listen on', type=int,
+                        default=PORT)
+    parser.add_argument('--cache_size', type=int, default=0,
+                        help='number of answers to keep, none by default')
+    parser.add_argument('--store', help='file to keep the answers in')
+    args = parser.parse_args()
+    server = make_server(args.host, args.port, args.cache_size, args.store)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
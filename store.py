@@ -0,0 +1,159 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Answers kept on disk, so they outlive the run that found them and are
+shared by every process that opens the same file.
+
+A SolutionStore holds the answers of a tasks.SymmetryCache in an SQLite
+database instead of memory:
+
+    cache = tasks.SymmetryCache(results=SolutionStore('solutions.db'))
+    tasks.solve(tasks.COLLECT, tasks.QUEEN, 'h2', ['g4', 'h5'],
+                cache=cache)
+
+Keys and answers are stored as JSON.  The store keeps about max_entries
+answers, dropping the least recently used ones in batches once it grows
+past that.  The database is in write ahead log mode and every process and
+thread gets its own connection, so readers never wait on a writer and
+writers queue up behind each other rather than failing.  Lookups only
+note when an answer was used, and the notes are written a batch at a
+time, so most lookups don't write at all.
+"""
+from __future__ import absolute_import
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+MAX_ENTRIES = 100000
+# inserts on a connection between checks of the store's size, so it may
+# hold this many more than max_entries for each connection writing to it
+TRIM_EVERY = 64
+# hits on a connection between writes of when their answers were used
+TOUCH_EVERY = 64
+# seconds to wait for another process to finish writing
+BUSY_TIMEOUT = 30.0
+
+
+class SolutionStore(object):
+    """
+    A least recently used mapping of answers in an SQLite file, with the
+    get and item assignment of tasks.LRUCache.
+    """
+
+    def __init__(self, path, max_entries=MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.local = threading.local()
+        self.hits = self.misses = self.evictions = 0
+        # make the table now rather than in the middle of a query
+        self.connect()
+
+    def connect(self):
+        # sqlite connections can't be shared between threads or carried
+        # over a fork, so each thread of each process opens its own
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT,
+                                         isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS solutions '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, '
+                'used REAL NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS solutions_used '
+                               'ON solutions (used)')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+            self.local.inserts = self.local.hits = 0
+            # when answers found since the last write were used, by key
+            self.local.touched = {}
+        return connection
+
+    def get(self, key, default=None):
+        key = json.dumps(key)
+        connection = self.connect()
+        row = connection.execute('SELECT value FROM solutions WHERE key = ?',
+                                 (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self.local.touched[key] = time.time()
+        self.local.hits += 1
+        if self.local.hits % TOUCH_EVERY == 0:
+            self.touch()
+        return json.loads(row[0])
+
+    def __setitem__(self, key, value):
+        connection = self.connect()
+        key = json.dumps(key)
+        self.local.touched.pop(key, None)
+        connection.execute(
+            'INSERT OR REPLACE INTO solutions VALUES (?, ?, ?)',
+            (key, json.dumps(value), time.time()))
+        self.local.inserts += 1
+        if self.local.inserts % TRIM_EVERY == 0:
+            self.trim()
+
+    def touch(self):
+        # write when the answers this connection found were last used, in
+        # one transaction
+        connection = self.connect()
+        touched = self.local.touched
+        if not touched:
+            return
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(
+                'UPDATE solutions SET used = ? WHERE key = ?',
+                [(used, key) for key, used in touched.items()])
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        touched.clear()
+
+    def trim(self):
+        # drop the least recently used answers beyond max_entries
+        self.touch()
+        cursor = self.connect().execute(
+            'DELETE FROM solutions WHERE key IN '
+            '(SELECT key FROM solutions ORDER BY used LIMIT '
+            'MAX(0, (SELECT COUNT(*) FROM solutions) - ?))',
+            (self.max_entries,))
+        self.evictions += cursor.rowcount
+
+    def __contains__(self, key):
+        return self.connect().execute(
+            'SELECT 1 FROM solutions WHERE key = ?',
+            (json.dumps(key),)).fetchone() is not None
+
+    def __len__(self):
+        return self.connect().execute(
+            'SELECT COUNT(*) FROM solutions').fetchone()[0]
+
+    def clear(self):
+        self.connect().execute('DELETE FROM solutions')
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self),
+                'maxsize': self.max_entries}
+
+    def close(self):
+        # close this thread's connection, another is opened if needed
+        connection = getattr(self.local, 'connection', None)
+        if connection is not None:
+            if self.local.pid == os.getpid():
+                self.touch()
+            self.local.connection = None
+            connection.close()
@@ -14,24 +14,220 @@ colored piece, so that for example, pawns would move from a2 to b2.
 from __future__ import absolute_import
 
 import argparse
-import math
+import contextlib
+import functools
+import heapq
+import inspect
+import itertools
+import json
+import mmap
+import os
+import string
 import sys
-from random import randrange
+import threading
+from collections import namedtuple
+from random import Random, randrange
+from timeit import default_timer
+
+import store
 
 # Some constants to avoid typos, and make the code easier to read
 # COLS and COLS_REVERSE are for switcing between indices and algebraic columns
 UP, RIGHT, LEFT, DOWN, UP_RIGHT, DOWN_RIGHT, DOWN_LEFT, UP_LEFT = range(8)
 COLS = {n: l for n, l in zip(range(8), list('abcdefgh'))}
-COLS_REVERSE = {v: k for k, v in COLS.items()}
+# every column letter, for boards wider than eight columns
+LETTERS = string.ascii_lowercase
+COLS_REVERSE = {l: n for n, l in enumerate(LETTERS)}
 PAWN = 'PAWN'
 ROOK = 'ROOK'
 KNIGHT = 'KNIGHT'
 BISHOP = 'BISHOP'
 QUEEN = 'QUEEN'
 KING = 'KING'
+PIECES = (PAWN, ROOK, KNIGHT, BISHOP, QUEEN, KING)
 
 EMPTY, FRIENDLY, ENEMY = range(3)
 
+# the questions a board can answer, see solve
+MOVES = 'moves'
+TARGET = 'target'
+COLLECT = 'collect'
+QUERIES = (MOVES, TARGET, COLLECT)
+
+# shortest path search strategies
+BFS = 'BFS'
+DFS = 'DFS'
+ASTAR = 'ASTAR'
+
+# Bitboard tables for the move generator.  Squares are numbered
+# row * 8 + col, so a1 is bit 0, h1 is bit 7 and h8 is bit 63.  Moves are
+# stored as shared (col, row) tuples in the same order that walking the
+# board with make_move produces them, so both engines find the same paths.
+STEPS = {UP: (0, 1), RIGHT: (1, 0), LEFT: (-1, 0), DOWN: (0, -1),
+         UP_RIGHT: (1, 1), DOWN_RIGHT: (1, -1), DOWN_LEFT: (-1, -1),
+         UP_LEFT: (-1, 1)}
+OPPOSITE = {UP: DOWN, DOWN: UP, LEFT: RIGHT, RIGHT: LEFT,
+            UP_RIGHT: DOWN_LEFT, DOWN_LEFT: UP_RIGHT,
+            UP_LEFT: DOWN_RIGHT, DOWN_RIGHT: UP_LEFT}
+# rays in these directions run towards higher square numbers
+ASCENDING = frozenset([UP, RIGHT, UP_RIGHT, UP_LEFT])
+ROOK_DIRECTIONS = (UP, RIGHT, DOWN, LEFT)
+BISHOP_DIRECTIONS = (UP_LEFT, UP_RIGHT, DOWN_LEFT, DOWN_RIGHT)
+QUEEN_DIRECTIONS = ROOK_DIRECTIONS + BISHOP_DIRECTIONS
+KING_DIRECTIONS = (UP, UP_RIGHT, RIGHT, DOWN_RIGHT,
+                   DOWN, DOWN_LEFT, LEFT, UP_LEFT)
+# pieces whose moves don't depend on where the enemies are
+FIXED_MOVES = frozenset([KNIGHT, KING])
+SLIDING_DIRECTIONS = {ROOK: ROOK_DIRECTIONS, BISHOP: BISHOP_DIRECTIONS,
+                      QUEEN: QUEEN_DIRECTIONS}
+KNIGHT_JUMPS = ((-1, 2), (1, 2), (-1, -2), (1, -2),
+                (-2, 1), (-2, -1), (2, 1), (2, -1))
+KING_STEPS = tuple(STEPS[d] for d in KING_DIRECTIONS)
+SQUARES = tuple((sq % 8, sq // 8) for sq in range(64))
+# Boards of other sizes number their squares the same way, row * width +
+# col, but are too big for tables of every move, see Board.get_grid_moves
+GRIDS = {(8, 8): SQUARES}
+MAX_BOARD_SIZE = 512
+
+
+def get_grid(width, height):
+    # the (col, row) squares of a width x height board by square number,
+    # shared by every board of that size
+    grid = GRIDS.get((width, height))
+    if grid is None:
+        grid = GRIDS[width, height] = tuple(
+            (sq % width, sq // width) for sq in range(width * height))
+    return grid
+
+
+def square_index(col, row, width=8):
+    return row * width + col
+
+
+def on_board(col, row, width=8, height=8):
+    return 0 <= col < width and 0 <= row < height
+
+
+def to_mask(squares, width=8):
+    mask = 0
+    for col, row in squares:
+        mask |= 1 << square_index(col, row, width)
+    return mask
+
+
+def iter_indices(bits):
+    # the square numbers set in a bitboard, lowest first
+    while bits:
+        lowest = bits & -bits
+        yield lowest.bit_length() - 1
+        bits ^= lowest
+
+
+def iter_squares(bits, grid=SQUARES):
+    # the (col, row) squares set in a bitboard, lowest first
+    for sq in iter_indices(bits):
+        yield grid[sq]
+
+
+# Zobrist keys, two for every square: one for an enemy on it and one for
+# a friendly piece.  A position hashes to the xor of the keys of its
+# occupied squares, so a square changing costs two xors.  Keys are 128
+# bits, too wide for two positions to share a hash in practice, and come
+# from a fixed seed so a position hashes the same in every process.
+ZOBRIST_SEED = 2016
+ZOBRIST_RANDOM = Random(ZOBRIST_SEED)
+ZOBRIST_KEYS = []
+ZOBRIST_LOCK = threading.Lock()
+
+
+def add_zobrist_keys(area):
+    # keys for every square of a board this big, made as they're needed.
+    # Boards of a new size may be set up in several threads at once.
+    if len(ZOBRIST_KEYS) < 2 * area:
+        with ZOBRIST_LOCK:
+            while len(ZOBRIST_KEYS) < 2 * area:
+                ZOBRIST_KEYS.append(ZOBRIST_RANDOM.getrandbits(128))
+
+
+def zobrist_hash(enemy_bits, occupied_bits):
+    zobrist = 0
+    for sq in iter_indices(enemy_bits):
+        zobrist ^= ZOBRIST_KEYS[2 * sq]
+    for sq in iter_indices(occupied_bits & ~enemy_bits):
+        zobrist ^= ZOBRIST_KEYS[2 * sq + 1]
+    return zobrist
+
+
+add_zobrist_keys(64)
+
+
+def _build_ray(col, row, step):
+    ray = []
+    col, row = col + step[0], row + step[1]
+    while on_board(col, row):
+        ray.append(SQUARES[square_index(col, row)])
+        col, row = col + step[0], row + step[1]
+    return tuple(ray)
+
+
+def _build_jumps(col, row, jumps):
+    return tuple(SQUARES[square_index(col + dc, row + dr)]
+                 for dc, dr in jumps if on_board(col + dc, row + dr))
+
+
+RAYS = {d: [_build_ray(c, r, step) for c, r in SQUARES]
+        for d, step in STEPS.items()}
+RAY_MASKS = {d: [to_mask(ray) for ray in rays] for d, rays in RAYS.items()}
+# number of king steps between two squares, which is also the number of
+# squares a slider covers when moving from one to the other along a ray
+DISTANCE = [[max(abs(c1 - c2), abs(r1 - r2)) for c2, r2 in SQUARES]
+            for c1, r1 in SQUARES]
+KING_MOVES = [_build_jumps(c, r, KING_STEPS) for c, r in SQUARES]
+KNIGHT_MOVES = [_build_jumps(c, r, KNIGHT_JUMPS) for c, r in SQUARES]
+# pawns capture up and to the right first, then up and to the left
+PAWN_CAPTURES = [_build_jumps(c, r, ((1, 1), (-1, 1))) for c, r in SQUARES]
+# the squares whose enemies can change a sliding piece's moves
+SLIDING_MASKS = dict((piece, [sum(RAY_MASKS[d][sq] for d in directions)
+                              for sq in range(64)])
+                     for piece, directions in SLIDING_DIRECTIONS.items())
+
+
+def _build_between(sq):
+    between = [0] * 64
+    for rays in RAYS.values():
+        for idx, square in enumerate(rays[sq]):
+            between[square_index(*square)] = to_mask(rays[sq][:idx])
+    return between
+
+
+# the squares strictly between two squares on the same ray
+BETWEEN = [_build_between(sq) for sq in range(64)]
+
+MOVE_CACHE_SIZE = 4096
+TRANSPOSITION_TABLE_SIZE = 4096
+DISTANCE_CACHE_SIZE = 256
+# move counts without parents are smaller, and the exact tour needs many
+COUNTS_CACHE_SIZE = 2048
+# bigger boards keep fewer of their bigger distance maps, but not too few
+MIN_CACHE_SIZE = 4
+# answers kept by a SymmetryCache unless it's given another size
+RESULT_CACHE_SIZE = 4096
+
+# enemies placed at random unless asked for more or fewer
+ENEMY_COUNT = 8
+# with more targets than this the nearest target first tour is too slow
+# for pieces whose moves the enemies don't change much, see
+# Board.get_improved_tour
+IMPROVE_TOUR_TARGETS = 16
+# the cost of a move between targets that can't be made, in tour costs
+UNREACHABLE_COST = 10 ** 6
+
+# empty board distance tables, see DistanceTables
+DISTANCE_TABLES_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'distances.bin')
+DISTANCE_TABLES_MAGIC = b'DIST0001'
+NO_SQUARE = 255
+
 
 class NoMoveError(Exception):
     pass
@@ -45,40 +241,653 @@ class IllegalPositionError(Exception):
     pass
 
 
+class OutOfTime(Exception):
+    # raised by a search once its board's deadline has passed, with
+    # whatever it had found by then
+
+    def __init__(self, found=None):
+        super(OutOfTime, self).__init__('The deadline has passed.')
+        self.found = found
+
+
+class Deadline(object):
+    """
+    A time limit in seconds for answering a query, which can also be
+    cancelled from another thread.  Searches check it as they go, and once
+    it has passed the query answers with the best it found so far.
+    """
+
+    def __init__(self, seconds=None):
+        self.end = None if seconds is None else default_timer() + seconds
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+    def expired(self):
+        return self.cancelled or (self.end is not None and
+                                  default_timer() >= self.end)
+
+
+# the answer to a query with a deadline, and whether it's known to be the
+# best there is
+Solution = namedtuple('Solution', ['moves', 'optimal'])
+# a leg of a collect tour as it's found: its moves, the moves made so far
+# including these, and whether the tour it's part of is the shortest
+Leg = namedtuple('Leg', ['moves', 'total', 'optimal'])
+
+
+class LRUCache(object):
+    """
+    Holds at most maxsize entries, dropping one that hasn't been used
+    lately to make room for a new one.  Counts its hits, misses and
+    evictions.  Safe to share between threads.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        # only stores and clears change the list, so they hold the lock
+        # and lookups never wait for it
+        self.lock = threading.Lock()
+        self.data = {}
+        # circular doubly linked list of [previous, next, key, value,
+        # used] links from the oldest store to the newest, with root as
+        # the sentinel
+        self.root = []
+        self.root[:] = [self.root, self.root, None, None, False]
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        # rather than move the entry to the back of the list, which would
+        # need the lock, a lookup just marks it as used
+        link = self.data.get(key)
+        if link is None:
+            self.misses += 1
+            return default
+        self.hits += 1
+        link[4] = True
+        return link[3]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            link = self.data.pop(key, None)
+            if link is not None:
+                link[0][1] = link[1]
+                link[1][0] = link[0]
+            elif len(self.data) >= self.maxsize:
+                self._evict()
+            link = [None, None, key, value, False]
+            self._append(link)
+            self.data[key] = link
+
+    def _evict(self):
+        # drop the oldest entry that hasn't been used since it was last
+        # passed over.  Used ones are passed over once, going to the back
+        # of the list, so this is nearly least recently used.
+        chances = len(self.data)
+        while True:
+            oldest = self.root[1]
+            self.root[1] = oldest[1]
+            oldest[1][0] = self.root
+            if oldest[4] and chances:
+                chances -= 1
+                oldest[4] = False
+                self._append(oldest)
+                continue
+            del self.data[oldest[2]]
+            self.evictions += 1
+            return
+
+    def _append(self, link):
+        last = self.root[0]
+        link[0] = last
+        link[1] = self.root
+        last[1] = self.root[0] = link
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.root[:] = [self.root, self.root, None, None, False]
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions, 'size': len(self.data),
+                'maxsize': self.maxsize}
+
+
+# sliding moves shared by every board, see Board.__init__
+MOVE_CACHE = LRUCache(MOVE_CACHE_SIZE)
+# shortest paths shared by every board, keyed by the Zobrist hash of the
+# position they were found in, see Board.get_shortest_path
+TRANSPOSITIONS = LRUCache(TRANSPOSITION_TABLE_SIZE)
+# held while a board makes its own caches, see Board.distance_maps
+CACHES_LOCK = threading.Lock()
+
+
+class Column(list):
+    """
+    One column of a board's squares.  Assignments are reported back to the
+    board so that its occupancy bitboards never go stale.
+    """
+    __slots__ = ('board', 'col')
+
+    def __init__(self, board, col, squares):
+        super(Column, self).__init__(squares)
+        self.board = board
+        self.col = col
+
+    def __setitem__(self, row, value):
+        super(Column, self).__setitem__(row, value)
+        self.board.update_square(self.col, row, value)
+
+
+class SearchStats(object):
+    """
+    Counters and wall times collected by a board as it answers queries.
+    Pass one to Board to switch instrumentation on.  hook, if given, is
+    called with the name of each query and as_dict() once it's answered.
+    Times are in seconds and include any nested phases, so a tour's time
+    includes the searches made for it.  Each query starts the stats
+    afresh, so they only ever hold one query's, and boards queried from
+    several threads at once need their own.
+    """
+    COUNTERS = ('nodes_expanded', 'move_generations', 'searches',
+                'move_cache_hits', 'move_cache_misses',
+                'distance_cache_hits', 'distance_cache_misses',
+                'distance_repairs', 'tour_improvements',
+                'transposition_hits')
+    PEAKS = ('max_depth', 'max_frontier')
+    # the last improved tour's length over the distance matrix, as first
+    # constructed and once improved, and a lower bound on any tour's
+    # and the moves the nearest target first tour would take instead
+    LATEST = ('constructed_moves', 'improved_moves', 'tour_lower_bound',
+              'greedy_moves')
+
+    def __init__(self, hook=None):
+        self.hook = hook
+        self.reset()
+
+    def reset(self):
+        self.counters = dict.fromkeys(
+            self.COUNTERS + self.PEAKS + self.LATEST, 0)
+        self.times = {}
+        self.active = set()
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def record(self, name, value):
+        self.counters[name] = value
+
+    def peak(self, name, value):
+        if value > self.counters[name]:
+            self.counters[name] = value
+
+    def add_time(self, phase, seconds):
+        self.times[phase] = self.times.get(phase, 0) + seconds
+
+    def as_dict(self):
+        stats = dict(self.counters)
+        stats.update(('{}_time'.format(phase), seconds)
+                     for phase, seconds in self.times.items())
+        return stats
+
+    def emit(self, query):
+        if self.hook:
+            self.hook(query, self.as_dict())
+
+
+def timed(phase, query=None):
+    # decorator for Board methods that adds their wall time to the
+    # board's stats, if it has any.  Calls nested inside a call for the
+    # same phase aren't counted twice.  Methods answering a query start
+    # the stats afresh and send them to the hook when they're done, unless
+    # they're part of another query.  A generator's time is the time
+    # taken to make its items, and it's done once it has made the last.
+    def decorator(method):
+        if inspect.isgeneratorfunction(method):
+            @functools.wraps(method)
+            def generator(self, *args, **kwargs):
+                items = method(self, *args, **kwargs)
+                stats = self.stats
+                if stats is None or phase in stats.active:
+                    for item in items:
+                        yield item
+                    return
+                top = query and not stats.active
+                if top:
+                    stats.reset()
+                while True:
+                    stats.active.add(phase)
+                    start = default_timer()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        break
+                    finally:
+                        stats.add_time(phase, default_timer() - start)
+                        stats.active.discard(phase)
+                    yield item
+                if top:
+                    stats.emit(query)
+            return generator
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            stats = self.stats
+            if stats is None or phase in stats.active:
+                return method(self, *args, **kwargs)
+            top = query and not stats.active
+            if top:
+                stats.reset()
+            stats.active.add(phase)
+            start = default_timer()
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                stats.add_time(phase, default_timer() - start)
+                stats.active.discard(phase)
+                if top:
+                    stats.emit(query)
+        return wrapper
+    return decorator
+
+
 class Board(object):
+    # The position is held in two integer bitboards, and the squares
+    # lists are only built if they're asked for.  Together with the slots
+    # this keeps boards small to hold, quick to clone and small to pickle.
+    __slots__ = ('piece', 'position', 'col', 'row', 'targets', 'best',
+                 'show', 'search', 'stats', 'enemy_bits', 'occupied_bits',
+                 'width', 'height', 'grid', 'standard', 'enemy_count',
+                 'random_enemies', 'deadline', 'move_cache', 'zobrist',
+                 'transpositions', '_squares', '_blockers',
+                 '_distance_maps', '_distance_counts')
 
-    def __init__(self, piece, position, place_enemies=False, show=False):
+    def __init__(self, piece, position, place_enemies=False, show=False,
+                 search=BFS, enemies=None, stats=None, width=8, height=8,
+                 enemy_count=None):
+        if not (0 < width <= MAX_BOARD_SIZE and
+                0 < height <= MAX_BOARD_SIZE):
+            raise ValueError('Boards can be from 1x1 to {0}x{0}.'.format(
+                MAX_BOARD_SIZE))
+        # the number of enemies place_enemies puts on the board
+        free = width * height - 1
+        if enemy_count is None:
+            enemy_count = min(ENEMY_COUNT, free)
+        elif not 0 <= enemy_count <= free:
+            raise ValueError(
+                'From 0 to {} enemies fit on the board.'.format(free))
+        self.enemy_count = enemy_count
         self.piece = piece
+        self.stats = stats
+        self.search = search
         self.position = position
-        self.col, self.row = from_algebraic(self.position)
-        self.setup_pieces(place_enemies)
-        self.targets = [(c, r) for c in range(8) for r in range(8)
-                        if self.squares[c][r] == ENEMY]
-        self.best = [0] * 100
+        self.set_size(width, height)
+        self.col, self.row = self.locate(self.position)
+        # sliding moves are shared by every board.  They're keyed by the
+        # enemies on the piece's rays, so changing any other square
+        # doesn't invalidate them and changing one on a ray never hits a
+        # stale entry.
+        self.move_cache = MOVE_CACHE
+        self.transpositions = TRANSPOSITIONS
+        self._distance_maps = self._distance_counts = None
+        self.setup_pieces(place_enemies, enemies)
+        self.targets = sorted(iter_squares(self.enemy_bits, self.grid))
+        self.best = None
+        self.deadline = None
         self.show = show
         if show:
             print self
 
-    def setup_pieces(self, place_enemies):
-        squares = [[EMPTY for _ in range(8)] for _ in range(8)]
-        squares[self.col][self.row] = FRIENDLY
+    def set_size(self, width, height):
+        self.width, self.height = width, height
+        self.grid = get_grid(width, height)
+        # the move and distance tables only cover 8x8 boards
+        self.standard = self.grid is SQUARES
+        self._blockers = None
+        add_zobrist_keys(width * height)
+
+    def locate(self, position):
+        # the (col, row) of a square given in algebraic notation
+        col, row = from_algebraic(position)
+        if not on_board(col, row, self.width, self.height):
+            raise IllegalPositionError(
+                '{} is not on the board.'.format(position))
+        return col, row
+
+    def cache_size(self, size):
+        # distance maps grow with the board, so bigger boards keep fewer
+        area = self.width * self.height
+        return max(MIN_CACHE_SIZE, size * 64 // max(64, area))
+
+    @property
+    def distance_maps(self):
+        # distance maps keyed by piece, enemy occupancy and origin.  Made
+        # on first use, as plenty of boards never search, and made only
+        # once however many threads search at first.
+        if self._distance_maps is None:
+            with CACHES_LOCK:
+                if self._distance_maps is None:
+                    self._distance_maps = LRUCache(
+                        self.cache_size(DISTANCE_CACHE_SIZE))
+        return self._distance_maps
+
+    @property
+    def distance_counts(self):
+        # move counts alone, keyed the same way, see get_distances
+        if self._distance_counts is None:
+            with CACHES_LOCK:
+                if self._distance_counts is None:
+                    self._distance_counts = LRUCache(
+                        self.cache_size(COUNTS_CACHE_SIZE))
+        return self._distance_counts
 
-        if place_enemies:
-            enemies = 8
+    def clone(self):
+        # a board in the same position, sharing this board's caches and
+        # targets, which are only ever replaced, never changed in place.
+        # The caches are made now so that both boards get the same ones.
+        self.distance_maps, self.distance_counts
+        board = Board.__new__(Board)
+        for name in Board.__slots__:
+            setattr(board, name, getattr(self, name))
+        board._squares = None
+        return board
+
+    def context(self):
+        # a board for one query to work on.  Searches keep their state on
+        # it, the best path so far and the deadline, and a tour makes its
+        # captures on it, so queries never change the board they're asked
+        # of.  One board can then answer queries from many threads at
+        # once, and answers don't depend on what was asked before.  The
+        # context is a clone, so it shares every cache and costs no more
+        # than copying a few attributes.
+        board = self.clone()
+        board.best = board.deadline = None
+        return board
+
+    @classmethod
+    def from_bits(cls, piece, origin, enemy_bits, width=8, height=8,
+                  search=BFS, stats=None):
+        # a board straight from the square number of the piece and a
+        # bitboard of its enemies, as made by the scenarios module,
+        # without parsing or placing a square at a time
+        grid = get_grid(width, height)
+        col, row = grid[origin]
+        targets = sorted(iter_squares(enemy_bits, grid))
+        board = cls.__new__(cls)
+        board.__setstate__((piece, to_algebraic(col, row), col, row,
+                            targets, False, search, enemy_bits,
+                            enemy_bits | 1 << origin, width, height,
+                            len(targets), False))
+        board.stats = stats
+        return board
+
+    def __getstate__(self):
+        # caches and stats stay behind, the position is just two ints
+        return (self.piece, self.position, self.col, self.row, self.targets,
+                self.show, self.search, self.enemy_bits, self.occupied_bits,
+                self.width, self.height, self.enemy_count,
+                self.random_enemies)
+
+    def __setstate__(self, state):
+        (self.piece, self.position, self.col, self.row, self.targets,
+         self.show, self.search, self.enemy_bits, self.occupied_bits,
+         width, height, self.enemy_count, self.random_enemies) = state
+        self.set_size(width, height)
+        self.best = self.deadline = None
+        self.stats = None
+        self.move_cache = MOVE_CACHE
+        self.transpositions = TRANSPOSITIONS
+        self.zobrist = zobrist_hash(self.enemy_bits, self.occupied_bits)
+        self._squares = self._distance_maps = self._distance_counts = None
+
+    @timed('setup')
+    def setup_pieces(self, place_enemies, enemies=None):
+        # enemies is a list of squares in algebraic notation, possibly
+        # empty, otherwise place_enemies puts enemy_count of them on
+        # random squares.  Only enemies placed at random are ever set up
+        # again, see get_fewest_moves_to_farthest_target.
+        self.random_enemies = enemies is None and bool(place_enemies)
+        self.enemy_bits = self.occupied_bits = self.zobrist = 0
+        self._squares = None
+        self.update_square(self.col, self.row, FRIENDLY)
+
+        if enemies is not None:
+            for enemy in enemies:
+                x, y = self.locate(enemy)
+                self.update_square(x, y, ENEMY)
+        elif place_enemies:
+            enemies = self.enemy_count
             while enemies:
-                x, y = randrange(8), randrange(8)
-                if not squares[x][y]:
-                    squares[x][y] = ENEMY
+                x, y = randrange(self.width), randrange(self.height)
+                if self.get_square(x, y) == EMPTY:
+                    self.update_square(x, y, ENEMY)
                     enemies -= 1
-        self.squares = squares
 
+    @property
+    def squares(self):
+        if self._squares is None:
+            columns = [[EMPTY] * self.height for _ in range(self.width)]
+            for col, row in iter_squares(self.occupied_bits, self.grid):
+                columns[col][row] = FRIENDLY
+            for col, row in iter_squares(self.enemy_bits, self.grid):
+                columns[col][row] = ENEMY
+            self._squares = [Column(self, col, column)
+                             for col, column in enumerate(columns)]
+        return self._squares
+
+    @squares.setter
+    def squares(self, squares):
+        self.enemy_bits = self.occupied_bits = self.zobrist = 0
+        self._squares = None
+        for col, column in enumerate(squares):
+            for row, square in enumerate(column):
+                if square != EMPTY:
+                    self.update_square(col, row, square)
+
+    def get_bit(self, col, row):
+        return 1 << square_index(col, row, self.width)
+
+    def get_square(self, col, row):
+        bit = self.get_bit(col, row)
+        if self.enemy_bits & bit:
+            return ENEMY
+        return FRIENDLY if self.occupied_bits & bit else EMPTY
+
+    def set_square(self, col, row, value):
+        if self._squares is None:
+            self.update_square(col, row, value)
+        else:
+            self._squares[col][row] = value
+
+    def update_square(self, col, row, value):
+        sq = square_index(col, row, self.width)
+        bit = 1 << sq
+        # the hash loses the square's old contents and gains its new ones
+        if self.enemy_bits & bit:
+            self.zobrist ^= ZOBRIST_KEYS[2 * sq]
+        elif self.occupied_bits & bit:
+            self.zobrist ^= ZOBRIST_KEYS[2 * sq + 1]
+        if value == ENEMY:
+            self.enemy_bits |= bit
+            self.zobrist ^= ZOBRIST_KEYS[2 * sq]
+        else:
+            self.enemy_bits &= ~bit
+        if value == EMPTY:
+            self.occupied_bits &= ~bit
+        else:
+            self.occupied_bits |= bit
+            if value != ENEMY:
+                self.zobrist ^= ZOBRIST_KEYS[2 * sq + 1]
+
+    @contextlib.contextmanager
+    def time_limit(self, deadline):
+        # searches made inside check the deadline, if there is one, and
+        # raise OutOfTime once it has passed
+        self.deadline = deadline
+        try:
+            yield
+        finally:
+            self.deadline = None
+
+    def check_deadline(self):
+        if self.deadline is not None and self.deadline.expired():
+            raise OutOfTime()
+
+    def make_capture(self, square):
+        # move the piece onto an enemy's square, taking the enemy off the
+        # board.  Only the two squares change, so the occupancy bitboards
+        # are updated in place and cached moves and distances for other
+        # occupancies stay valid.  Returns what unmake_capture needs to
+        # put things back.
+        undo = (self.col, self.row), square, self.get_square(*square)
+        self.set_square(self.col, self.row, EMPTY)
+        self.col, self.row = square
+        self.set_square(self.col, self.row, FRIENDLY)
+        return undo
+
+    def unmake_capture(self, undo):
+        origin, square, captured = undo
+        self.set_square(square[0], square[1], captured)
+        self.col, self.row = origin
+        self.set_square(self.col, self.row, FRIENDLY)
+
+    @timed('moves', MOVES)
     def get_available_moves(self):
         moves = self._get_available_moves(self.piece, self.col, self.row)
-        for idx, move in enumerate(moves):
-            moves[idx] = to_algebraic(*move)
+        moves = [to_algebraic(*move) for move in moves]
         return moves or 'No moves are available.'
 
-    def _get_available_moves(self, piece, col, row):
+    def _get_available_moves(self, piece, col, row, enemies=None):
+        # enemies is a bitboard to search with instead of the enemies
+        # currently on the board, e.g. with some of them already captured
+        if enemies is None:
+            enemies = self.enemy_bits
+        stats = self.stats
+        if stats is not None:
+            stats.count('move_generations')
+        if not self.standard:
+            return self.get_grid_moves(piece, col, row, enemies)
+        sq = square_index(col, row)
+        if piece in SLIDING_DIRECTIONS:
+            key = piece, sq, enemies & SLIDING_MASKS[piece][sq]
+            moves = self.move_cache.get(key)
+            if moves is None:
+                moves = self.get_sliding_moves(
+                    sq, SLIDING_DIRECTIONS[piece], enemies)
+                self.move_cache[key] = moves
+                if stats is not None:
+                    stats.count('move_cache_misses')
+            elif stats is not None:
+                stats.count('move_cache_hits')
+            return moves
+        # knight, king and pawn moves are cheaper to look up than to cache
+        elif piece == KNIGHT:
+            return KNIGHT_MOVES[sq]
+        elif piece == KING:
+            return KING_MOVES[sq]
+        elif piece == PAWN:
+            return self.get_pawn_pushes_and_captures(col, row, enemies)
+        return []
+
+    def get_sliding_moves(self, sq, directions, enemies):
+        moves = []
+        for direction in directions:
+            moves.extend(get_ray_moves(sq, direction, enemies))
+        return tuple(moves)
+
+    def get_pawn_pushes_and_captures(self, col, row, enemies):
+        if row == 0:
+            msg = 'This is not a valid position for a pawn.'
+            raise IllegalPositionError(msg)
+        if row == 7:
+            return []
+        sq = square_index(col, row)
+        occupied = enemies | self.occupied_bits & ~self.enemy_bits
+        moves = [move for move in PAWN_CAPTURES[sq]
+                 if enemies >> square_index(*move) & 1]
+        if not occupied >> (sq + 8) & 1:
+            moves.append(SQUARES[sq + 8])
+            if row == 1 and not occupied >> (sq + 16) & 1:
+                moves.append(SQUARES[sq + 16])
+        return moves
+
+    def get_grid_moves(self, piece, col, row, enemies):
+        # moves on boards other than 8x8, found by walking the board in
+        # the same order as the tables list them
+        width, height, grid = self.width, self.height, self.grid
+        if piece in FIXED_MOVES:
+            jumps = KNIGHT_JUMPS if piece == KNIGHT else KING_STEPS
+            return [grid[(row + dr) * width + col + dc] for dc, dr in jumps
+                    if 0 <= col + dc < width and 0 <= row + dr < height]
+        blocked, occupied = self.get_blockers(enemies)
+        if piece in SLIDING_DIRECTIONS:
+            moves = []
+            for direction in SLIDING_DIRECTIONS[piece]:
+                moves.extend(self.walk_ray(col, row, direction, blocked))
+            return moves
+        elif piece == PAWN:
+            if row == 0:
+                msg = 'This is not a valid position for a pawn.'
+                raise IllegalPositionError(msg)
+            if row == height - 1:
+                return []
+            up = square_index(col, row + 1, width)
+            moves = [grid[up + dc] for dc in (1, -1)
+                     if 0 <= col + dc < width and up + dc in blocked]
+            if up not in occupied:
+                moves.append(grid[up])
+                if (row == 1 and row + 2 < height and
+                        up + width not in occupied):
+                    moves.append(grid[up + width])
+            return moves
+        return []
+
+    def get_blockers(self, enemies):
+        # the square numbers of the enemies, and of every piece, as sets.
+        # A big board's bitboards are too long to test a square at a time,
+        # so the sets are made once per occupancy and kept.
+        key = enemies, self.enemy_bits, self.occupied_bits
+        if self._blockers is not None:
+            found, blockers = self._blockers
+            if all(a is b or a == b for a, b in zip(key, found)):
+                return blockers
+        blocked = frozenset(iter_indices(enemies))
+        friendly = self.occupied_bits & ~self.enemy_bits
+        blockers = blocked, blocked | frozenset(iter_indices(friendly))
+        self._blockers = key, blockers
+        return blockers
+
+    def walk_ray(self, col, row, direction, blocked):
+        # the squares along a ray up to and including the nearest enemy,
+        # like get_ray_moves does with the tables
+        dc, dr = STEPS[direction]
+        moves = []
+        col, row = col + dc, row + dr
+        while on_board(col, row, self.width, self.height):
+            sq = square_index(col, row, self.width)
+            moves.append(self.grid[sq])
+            if sq in blocked:
+                break
+            col, row = col + dc, row + dr
+        return moves
+
+    def get_ray(self, square, direction, enemies):
+        if self.standard:
+            return get_ray_moves(square_index(*square), direction, enemies)
+        return self.walk_ray(square[0], square[1], direction,
+                             self.get_blockers(enemies)[0])
+
+    def _walk_available_moves(self, piece, col, row):
+        # the original move generator, which walks the board one square
+        # at a time.  Kept as the reference for the bitboard tables.
         moves = []
         if piece == PAWN:
             moves = self.get_pawn_moves(col, row)
@@ -122,9 +931,9 @@ class Board(object):
         moves = []
         # since we move straight but capture diagonally need to peek
         # at squares first
-        if row == 7:
+        if row == self.height - 1:
             return moves
-        if col < 7:
+        if col < self.width - 1:
             if self.squares[col + 1][row + 1] == ENEMY:
                 moves.append(self.move_right(*self.move_up(col, row)))
         if col > 0:
@@ -133,9 +942,9 @@ class Board(object):
 
         if self.squares[col][row + 1] == EMPTY:
             moves.append(self.move_up(col, row))
-        if row == 1:
-            if self.squares[col][row + 2] == EMPTY:
-                moves.append(self.move_up(*moves[-1]))
+            if row == 1 and row + 2 < self.height:
+                if self.squares[col][row + 2] == EMPTY:
+                    moves.append(self.move_up(*moves[-1]))
         return moves
 
     def get_rook_moves(self, col, row):
@@ -193,7 +1002,7 @@ class Board(object):
         return [move for move in moves if move]
 
     def move_up(self, col, row):
-        if row == 7:
+        if row == self.height - 1:
             raise NoMoveError()
         else:
             return col, row + 1
@@ -211,86 +1020,303 @@ class Board(object):
             return col - 1, row
 
     def move_right(self, col, row):
-        if col == 7:
+        if col == self.width - 1:
             raise NoMoveError()
         else:
             return col + 1, row
 
-    def get_bishop_targets(self, targets):
-        origin_color = (self.col - self.row) % 2
-        to_remove = []
-        for target in targets:
-            # same color?
-            target_color = (target[0] - target[1]) % 2
-            if target_color != origin_color:
-                to_remove.append(target)
-        for t in to_remove:
-            targets.remove(t)
-        return targets
-
-    def get_pawn_targets(self, targets):
-        enemies_this_col = [(self.col, r) for r in range(8)
-                            if self.squares[self.col][r] == ENEMY]
-        to_remove = []
-        for target in targets:
-            blocked = [e for e in enemies_this_col if e[1] < target[1]]
-            wrong_column = abs(target[0] - self.col) != 1
-            is_behind_pawn = target[1] <= self.row
-            if blocked or wrong_column or is_behind_pawn:
-                to_remove.append(target)
-        for t in to_remove:
-            targets.remove(t)
-        return targets
-
-    def get_farthest_target(self):
-        targets = [(c, r) for c in range(8) for r in range(8)
-                   if self.squares[c][r] == ENEMY]
-        if self.piece == BISHOP:
-            targets = self.get_bishop_targets(targets)
-        elif self.piece == PAWN:
-            targets = self.get_pawn_targets(targets)
+    @timed('targets')
+    def get_farthest_target(self, distances=None):
+        # the enemy that takes the most moves to reach, with ties going to
+        # the one farthest away on the board.  Targets that can't be
+        # reached at all (wrong colored square for a bishop, or out of a
+        # pawn's capture lanes) are never picked.
+        if distances is None:
+            distances, _ = self.get_distance_map((self.col, self.row))
+        targets = [target for target in
+                   sorted(iter_squares(self.enemy_bits, self.grid))
+                   if target in distances]
 
         farthest = None
         farthest_target = None
         x1, y1 = self.col, self.row
         for x2, y2 in targets:
-            dist = math.sqrt((x2 - x1) ** 2 + (y2 - y1) ** 2)
-            if dist > farthest:
+            dist = distances[x2, y2], (x2 - x1) ** 2 + (y2 - y1) ** 2
+            if farthest_target is None or dist > farthest:
                 farthest = dist
                 farthest_target = x2, y2
 
         return farthest_target
 
-    def get_fewest_moves_to_all_targets(self):
-        # approximate solution
-        steps = []
+    @timed('tour', COLLECT)
+    def get_fewest_moves_to_all_targets(self, exact=False, improve=None,
+                                        deadline=None):
+        # by default this is an approximate solution that always goes for
+        # the nearest target.  With exact the order of the targets comes
+        # from get_shortest_tour instead, and with improve it comes from
+        # get_improved_tour.  That's the default for more than
+        # IMPROVE_TOUR_TARGETS targets, except for sliding pieces, which
+        # it rarely beats the nearest target first for.
+        #
+        # With a deadline the answer is a Solution.  Once the deadline
+        # passes, an exact tour makes do with an improved one, an improved
+        # tour stops improving or makes do with the nearest target first,
+        # and the tour stops with the legs it has found so far, which
+        # then capture fewer than all the targets.
+        legs = []
+        total = 0
+        # no targets can only be collected one way
+        optimal = True
+        for leg in self.iter_legs(exact, improve, deadline):
+            legs.append(leg.moves)
+            total, optimal = leg.total, leg.optimal
+        optimal = optimal and len(legs) == len(self.targets)
+
+        if self.show:
+            print 'targets: {} '.format(
+                [to_algebraic(*t) for t in self.targets])
+            print '{} total steps to capture all targets'.format(total - 1)
+        if deadline is None:
+            return legs
+        return Solution(legs, optimal)
+
+    def iter_legs(self, exact=False, improve=None, deadline=None):
+        # the legs of get_fewest_moves_to_all_targets' tour, each yielded
+        # as a Leg as soon as it's found rather than once they all are.
+        # The nearest target first tour starts straight away, the others
+        # once the order of the targets has been worked out.  With a
+        # deadline the legs stop once it has passed, even if some targets
+        # are left.  The piece captures its way around a context, leaving
+        # the board as it was.
+        return self.context()._iter_legs(exact, improve, deadline)
+
+    @timed('legs', COLLECT)
+    def _iter_legs(self, exact, improve, deadline):
         remaining = self.targets[:]
         origin = (self.col, self.row)
+        if improve is None:
+            improve = (len(remaining) > IMPROVE_TOUR_TARGETS and
+                       self.piece not in SLIDING_DIRECTIONS)
+        # one target can only be collected one way
+        optimal = len(remaining) <= 1
+        order = None
+        # with a deadline an exact tour starts from an improved one, to
+        # fall back on if it isn't finished in time
+        if improve and not exact or exact and deadline is not None:
+            try:
+                with self.time_limit(deadline):
+                    order = self.get_improved_tour(origin, remaining)
+            except OutOfTime:
+                pass
+        if exact:
+            try:
+                with self.time_limit(deadline):
+                    shortest = self.get_shortest_tour(origin, remaining)
+            except OutOfTime:
+                pass
+            else:
+                if shortest is None:
+                    raise NoPathToTargetError(
+                        'Not every target can be reached.')
+                order, optimal = shortest, True
+        total = 0
         while remaining:
-            self.best = [0] * 100
-            moves = self.get_nearest_target(origin, remaining)
-            steps.append(moves[1:])
+            self.best = None
+            target = order.pop(0) if order is not None else None
+            try:
+                with self.time_limit(deadline):
+                    moves = self.get_next_leg(origin, target, remaining)
+            except OutOfTime:
+                # the tour stops short, with the legs found so far
+                return
+            step = moves[1:]
             origin = moves.pop()
             # update our inner state
-            self.squares[self.col][self.row] = EMPTY
-            self.col, self.row = origin
-            self.squares[self.col][self.row] = FRIENDLY
+            self.make_capture(origin)
             if self.show:
                 print self
             if remaining:
                 remaining.remove(origin)
+            total += len(step)
+            yield Leg([to_algebraic(*s) for s in step], total, optimal)
 
-        total = sum([len(s) for s in steps]) - 1
-        if self.show:
-            print 'targets: {} '.format(
-                [to_algebraic(*t) for t in self.targets])
-            print '{} total steps to capture all targets'.format(total)
-        return [[to_algebraic(*s) for s in step] for step in steps]
+    def get_next_leg(self, origin, target, remaining, search=None):
+        # the moves to target, or to the nearest of the remaining targets
+        # if there's no tour to follow
+        if target is None:
+            moves = self.get_nearest_target(origin, remaining, search=search)
+        else:
+            moves = self.get_shortest_path(origin, target, search=search)
+        if not moves:
+            raise NoPathToTargetError('Not every target can be reached.')
+        return moves
+
+    def get_shortest_tour(self, origin, targets):
+        # Held-Karp dynamic programming over the subsets of captured
+        # targets.  cost[mask][j] is the fewest moves needed to capture
+        # exactly the targets in mask, finishing on targets[j].  Each
+        # subset is searched with its captured targets off the board.
+        # Returns the targets in capture order, or None if they can't all
+        # be reached.
+        if not targets:
+            return []
+        n = len(targets)
+        full = (1 << n) - 1
+        bits = [self.get_bit(*target) for target in targets]
+        # rows are only made for subsets that can be captured, a capture
+        # at a time, so there's no long wait or huge table to set up for
+        # many targets before a deadline check
+        cost, previous, captured = {}, {}, {}
+        distances, _ = self.get_distance_map(origin)
+        for j, target in enumerate(targets):
+            if target in distances:
+                cost[1 << j] = [None] * n
+                previous[1 << j] = [None] * n
+                captured[1 << j] = bits[j]
+                cost[1 << j][j] = distances[target]
+        # subsets with one more capture, each found from the ones before
+        subsets = sorted(cost)
+        while subsets:
+            reached = []
+            for mask in subsets:
+                self.check_deadline()
+                enemies = self.enemy_bits & ~captured[mask]
+                for j in range(n):
+                    moves = cost[mask][j]
+                    if moves is None:
+                        continue
+                    # the same square with one fewer capture was done
+                    # earlier and is repaired rather than searched again
+                    removed = [targets[k] for k in range(n)
+                               if k != j and mask >> k & 1]
+                    distances = self.get_distances(targets[j], enemies,
+                                                   removed)
+                    for k in range(n):
+                        if mask >> k & 1 or targets[k] not in distances:
+                            continue
+                        total = moves + distances[targets[k]]
+                        after = mask | 1 << k
+                        if after not in cost:
+                            cost[after] = [None] * n
+                            previous[after] = [None] * n
+                            captured[after] = captured[mask] | bits[k]
+                            reached.append(after)
+                        if cost[after][k] is None or total < cost[after][k]:
+                            cost[after][k] = total
+                            previous[after][k] = j
+            subsets = sorted(reached)
+
+        finishes = [j for j in range(n)
+                    if full in cost and cost[full][j] is not None]
+        if not finishes:
+            return None
+        last = min(finishes, key=lambda j: cost[full][j])
+        order = []
+        mask = full
+        while last is not None:
+            order.append(targets[last])
+            mask, last = mask ^ 1 << last, previous[mask][last]
+        order.reverse()
+        return order
+
+    def get_improved_tour(self, origin, targets):
+        # an order for the targets that's quick to find however many there
+        # are.  Tours are built and improved over the distance matrix,
+        # which is searched once with every target on the board.  For all
+        # but pawns the enemies only get in the way, so the matrix can
+        # overestimate the moves a leg takes, but never underestimate them.
+        # Captures open up lines for sliding pieces, which the nearest
+        # target first tour makes use of, so that tour is taken instead if
+        # it's shorter.
+        nodes = [origin] + targets
+        matrix = self.get_distance_matrix(origin, targets)
+        cost = [[0 if a == b else matrix[a].get(b, UNREACHABLE_COST)
+                 for b in nodes] for a in nodes]
+        tour = self.construct_tour(cost)
+        constructed = tour_length(cost, tour)
+        self.refine_tour(cost, tour)
+        if self.stats is not None or self.show:
+            symmetric = self.piece != PAWN
+            moves = tour_length(cost, tour)
+            lower_bound = tour_lower_bound(cost, symmetric)
+            if self.stats is not None:
+                self.stats.record('constructed_moves', constructed)
+                self.stats.record('improved_moves', moves)
+                self.stats.record('tour_lower_bound', lower_bound)
+            if self.show:
+                print 'tour of about {} moves, from {} at first, {} at best'\
+                    .format(moves, constructed, lower_bound)
+        order = [nodes[node] for node in tour[1:]]
+        greedy, greedy_moves = self.get_greedy_tour(origin, targets)
+        if self.stats is not None:
+            self.stats.record('greedy_moves', greedy_moves)
+        if greedy_moves is None:
+            return order
+        moves = self.get_tour_moves(origin, order)
+        return greedy if moves is None or greedy_moves < moves else order
+
+    def get_greedy_tour(self, origin, targets):
+        # the order the nearest target first tour captures the targets in,
+        # and the moves it takes, found from move counts without moving
+        # the piece.  The moves are None if a target can't be reached.
+        enemies = self.enemy_bits
+        remaining = targets[:]
+        order = []
+        moves = 0
+        while remaining:
+            distances = self.get_distances(origin, enemies)
+            reachable = [t for t in remaining if t in distances]
+            if not reachable:
+                return order + remaining, None
+            origin = min(reachable, key=distances.get)
+            moves += distances[origin]
+            enemies &= ~self.get_bit(*origin)
+            remaining.remove(origin)
+            order.append(origin)
+        return order, moves
+
+    def get_tour_moves(self, origin, order):
+        # the moves taken to capture the targets in order, each one off the
+        # board once it's captured, or None if one can't be reached
+        enemies = self.enemy_bits
+        moves = 0
+        for target in order:
+            distances = self.get_distances(origin, enemies)
+            if target not in distances:
+                return None
+            moves += distances[target]
+            enemies &= ~self.get_bit(*target)
+            origin = target
+        return moves
+
+    @timed('construct')
+    def construct_tour(self, cost):
+        tours = [nearest_neighbour_tour(cost), farthest_insertion_tour(cost)]
+        return min(tours, key=lambda tour: tour_length(cost, tour))
+
+    @timed('improve')
+    def refine_tour(self, cost, tour):
+        # pawns only move forwards, so can't go back along a stretch of
+        # the tour the other way
+        improvements = improve_tour(cost, tour, self.piece != PAWN,
+                                    deadline=self.deadline)
+        if self.stats is not None:
+            self.stats.count('tour_improvements', improvements)
+
+    def get_nearest_target(self, origin, targets, enemies=None, search=None):
+        search = search or self.search
+        if search == BFS:
+            # one search from origin reaches every target
+            distances, parents = self.get_distance_map(
+                origin, enemies=enemies)
+            reachable = [t for t in targets if t in distances and t != origin]
+            if not reachable:
+                return None
+            return trace_path(parents, min(reachable, key=distances.get))
 
-    def get_nearest_target(self, origin, targets):
         nearest = None
         for target in targets:
-            moves = self.get_shortest_path(origin, target, [], {})
+            moves = self.get_shortest_path(origin, target, [], {}, search)
             if not moves:
                 # this target may return no moves if a previous target
                 # was a direct capture
@@ -299,23 +1325,384 @@ class Board(object):
                 nearest = moves[:]
         return nearest
 
-    def get_fewest_moves_to_farthest_target(self):
+    @timed('query', TARGET)
+    def get_fewest_moves_to_farthest_target(self, deadline=None):
+        # with a deadline the answer is a Solution.  If the deadline
+        # passes before every square has been searched, it's the path to
+        # the farthest target found by then, if any.
+        return self.context()._get_fewest_moves_to_farthest_target(deadline)
+
+    def _get_fewest_moves_to_farthest_target(self, deadline):
         origin = self.col, self.row
-        target = self.get_farthest_target()
-        # may need to set up the targets again
-        # if they are not valid for this piece
-        while not target:
-            self.setup_pieces(True)
-            target = self.get_farthest_target()
-        path = self.get_shortest_path(origin, target, [], {})
+        optimal = True
+        try:
+            with self.time_limit(deadline):
+                distances, parents = self.get_distance_map(origin)
+        except OutOfTime as e:
+            (distances, parents), optimal = e.found, False
+        target = self.get_farthest_target(distances)
+        # may need to set up the targets again if they were placed at
+        # random and are not valid for this piece, unless no layout has a
+        # target it can reach.  Enemies given to the board are its layout,
+        # and with none it can reach there's no path.
+        if (not target and optimal and self.random_enemies and
+                self.can_capture()):
+            try:
+                with self.time_limit(deadline):
+                    while not target:
+                        self.setup_pieces(True)
+                        distances, parents = self.get_distance_map(origin)
+                        target = self.get_farthest_target(distances)
+            except OutOfTime:
+                optimal = False
+        if not target:
+            path = []
+        elif self.search == BFS or not optimal:
+            path = trace_path(parents, target)
+        else:
+            try:
+                with self.time_limit(deadline):
+                    path = self.get_shortest_path(origin, target, [], {})
+            except OutOfTime:
+                # the breadth first search found one just as short
+                path = trace_path(parents, target)
 
-        if self.show:
+        if self.show and path:
             print '{} move{} from {} to {}'.format(
                 len(path) - 1, '' if len(path) == 2 else 's',
                 to_algebraic(*origin), to_algebraic(*target))
-        return [to_algebraic(*p) for p in path if p]
+        moves = [to_algebraic(*p) for p in path if p]
+        if deadline is None:
+            return moves
+        return Solution(moves, optimal)
+
+    def can_capture(self):
+        # whether an enemy placed on some square could be captured straight
+        # away, so that placing enemies at random can give the piece a
+        # target.  Pawns only capture, up and to either side.
+        if not self.enemy_count:
+            return False
+        if self.piece == PAWN:
+            return self.width > 1 and self.row < self.height - 1
+        return bool(self._get_available_moves(self.piece, self.col,
+                                              self.row, 0))
+
+    @timed('search')
+    def get_shortest_path(self, origin, target, path=None, seen=None,
+                          search=None):
+        search = search or self.search
+        # paths are kept in the transposition table, so searching again in
+        # a position any board has been in before is a lookup.  A depth
+        # first search also carries on from the best path so far, so it
+        # can only use the table when it starts afresh.  It keeps its best
+        # path on the board, so the queries above run it on a context.
+        fresh = search != DFS or not (path or seen or self.best)
+        key = (search, self.piece, self.width, self.height, self.zobrist,
+               origin, target)
+        if fresh:
+            found = self.transpositions.get(key)
+            if found is not None:
+                if self.stats is not None:
+                    self.stats.count('transposition_hits')
+                if search == DFS:
+                    self.best = found[:] or None
+                return found[:]
+        if search == DFS:
+            moves = self.get_depth_first_path(
+                origin, target, [] if path is None else path,
+                {} if seen is None else seen) or []
+        elif search == ASTAR:
+            moves = self.get_a_star_path(origin, target)
+        else:
+            moves = self.get_breadth_first_path(origin, target)
+        if fresh:
+            self.transpositions[key] = moves[:]
+        return moves
+
+    def get_breadth_first_path(self, origin, target):
+        # an empty list means the target can't be reached
+        path = self.get_table_path(origin, target)
+        if path is not None:
+            return path
+        _, parents = self.get_distance_map(origin, target)
+        if target not in parents:
+            return []
+        return trace_path(parents, target)
+
+    def get_table_path(self, origin, target, enemies=None):
+        # enemies only ever take moves away from a knight, bishop, rook,
+        # queen or king, so if the shortest path on an empty board isn't
+        # blocked it's also the shortest path here.  It's the same path
+        # the breadth first search would find, too.  Returns None if the
+        # path is blocked and has to be searched for.
+        if self.piece not in TABLE_PIECES or not self.standard:
+            return None
+        path = DISTANCE_TABLES.path(self.piece, origin, target)
+        if self.piece in SLIDING_DIRECTIONS and path:
+            if enemies is None:
+                enemies = self.enemy_bits
+            for start, end in zip(path, path[1:]):
+                if BETWEEN[square_index(*start)][square_index(*end)] & enemies:
+                    return None
+        return path
+
+    def get_a_star_path(self, origin, target, enemies=None):
+        # squares are expanded in order of the moves taken to reach them
+        # plus a lower bound on the moves still needed, preferring the
+        # deepest on ties, so the search heads straight for the target
+        # until something blocks it.  An empty list means the target
+        # can't be reached.
+        if enemies is None:
+            enemies = self.enemy_bits
+        lower_bound = self.get_lower_bound()
+        estimate = lower_bound(origin, target)
+        if estimate is None:
+            return []
+        stats = self.stats
+        if stats is not None:
+            stats.count('searches')
+        parents = {origin: None}
+        moves_to = {origin: 0}
+        order = itertools.count()
+        queue = [(estimate, 0, next(order), origin)]
+        while queue:
+            self.check_deadline()
+            _, moves, _, square = heapq.heappop(queue)
+            moves = -moves
+            if square == target:
+                return trace_path(parents, target)
+            if moves > moves_to[square]:
+                # already expanded along a shorter path
+                continue
+            if stats is not None:
+                stats.count('nodes_expanded')
+                stats.peak('max_frontier', len(queue) + 1)
+            col, row = square
+            for move in self._get_available_moves(
+                    self.piece, col, row, enemies):
+                if moves_to.get(move, moves + 2) <= moves + 1:
+                    continue
+                estimate = lower_bound(move, target)
+                if estimate is None:
+                    continue
+                moves_to[move] = moves + 1
+                parents[move] = square
+                heapq.heappush(queue, (moves + 1 + estimate, -moves - 1,
+                                       next(order), move))
+        return []
 
-    def get_shortest_path(self, origin, target, path, seen):
+    def get_lower_bound(self):
+        # a function giving the fewest moves between two squares with no
+        # enemies in the way, which enemies can only add to.  The distance
+        # tables have it exactly for 8x8 boards, and a formula gives a
+        # lower bound on other boards and for pawns.
+        if self.standard and self.piece in TABLE_PIECES:
+            return functools.partial(DISTANCE_TABLES.distance, self.piece)
+        return LOWER_BOUNDS[self.piece]
+
+    def get_distance_matrix(self, origin=None, targets=None, captured=()):
+        # move counts from origin and from each target to every other
+        # target, searched with the captured targets taken off the board.
+        # Rows come from the cached distance maps, so asking again for the
+        # same enemy occupancy costs no searching.
+        if origin is None:
+            origin = self.col, self.row
+        if targets is None:
+            targets = self.targets
+        enemies = self.enemy_bits & ~to_mask(captured, self.width)
+        targets = [t for t in targets if t not in captured]
+        matrix = {}
+        for source in [origin] + targets:
+            distances = self.get_distances(source, enemies, captured)
+            matrix[source] = dict((t, distances[t]) for t in targets
+                                  if t in distances and t != source)
+        return matrix
+
+    @timed('search')
+    def get_distance_map(self, origin, target=None, enemies=None):
+        # breadth first search from origin, stopping early if target is
+        # reached.  Squares are expanded a whole move at a time, so each
+        # one is first reached along a shortest path.  Returns the number
+        # of moves to every square reached and the parent pointers for
+        # tracing those paths back to origin.  Complete maps are cached
+        # per enemy occupancy and must not be modified by callers.
+        if enemies is None:
+            enemies = self.enemy_bits
+        if target is None:
+            key = self.piece, self.occupancy_key(enemies), origin
+            found = self.distance_maps.get(key)
+            if found is None:
+                found = self._search_distances(origin, None, enemies)
+                self.distance_maps[key] = found
+                if self.stats is not None:
+                    self.stats.count('distance_cache_misses')
+            elif self.stats is not None:
+                self.stats.count('distance_cache_hits')
+            return found
+        return self._search_distances(origin, target, enemies)
+
+    def get_distances(self, origin, enemies=None, removed=()):
+        # move counts from origin, like get_distance_map but without
+        # parents.  removed lists squares whose enemies might have been
+        # taken off since move counts were last found, and if counts from
+        # origin with any one of them still on the board are cached,
+        # they're repaired instead of searching again.
+        if enemies is None:
+            enemies = self.enemy_bits
+        key = self.piece, self.occupancy_key(enemies), origin
+        found = self.distance_maps.get(key)
+        if found is not None:
+            return found[0]
+        distances = self.distance_counts.get(key)
+        if distances is not None:
+            return distances
+        if self.piece in SLIDING_DIRECTIONS:
+            for square in removed:
+                before = enemies | self.get_bit(*square)
+                if before == enemies:
+                    continue
+                distances = self.distance_counts.get(
+                    (self.piece, before, origin))
+                if distances is not None:
+                    distances = self.repair_distances(
+                        distances, square, enemies)
+                    break
+        if distances is None:
+            distances = self.get_distance_map(origin, enemies=enemies)[0]
+        self.distance_counts[key] = distances
+        return distances
+
+    @timed('search')
+    def repair_distances(self, distances, removed, enemies):
+        # distances were found with an enemy on the removed square.  With
+        # it gone, sliding moves along the rays through the square run on
+        # past it, and nothing else changes.  So only squares beyond it
+        # can get closer, and improvements are passed on from there in
+        # order of their new move counts.
+        if self.stats is not None:
+            self.stats.count('distance_repairs')
+        distances = dict(distances)
+        queue = []
+        for direction in SLIDING_DIRECTIONS[self.piece]:
+            behind = [distances[square] for square in
+                      self.get_ray(removed, OPPOSITE[direction], enemies)
+                      if square in distances]
+            if not behind:
+                continue
+            moves = min(behind) + 1
+            for square in self.get_ray(removed, direction, enemies):
+                if distances.get(square, moves + 1) > moves:
+                    distances[square] = moves
+                    heapq.heappush(queue, (moves, square))
+        while queue:
+            moves, square = heapq.heappop(queue)
+            if distances[square] < moves:
+                continue
+            col, row = square
+            for move in self._get_available_moves(
+                    self.piece, col, row, enemies):
+                if distances.get(move, moves + 2) > moves + 1:
+                    distances[move] = moves + 1
+                    heapq.heappush(queue, (moves + 1, move))
+        return distances
+
+    def occupancy_key(self, enemies):
+        # knights and kings move the same whatever the enemies are
+        if self.piece in FIXED_MOVES:
+            return None
+        if self.piece == PAWN:
+            # pawn pushes are also blocked by friendly pieces
+            return enemies, self.occupied_bits & ~self.enemy_bits
+        return enemies
+
+    def _search_distances(self, origin, target, enemies):
+        if self.piece in SLIDING_DIRECTIONS and not self.standard:
+            return self._search_sliding_distances(origin, target, enemies)
+        distances = {origin: 0}
+        parents = {origin: None}
+        frontier = [origin]
+        depth = 0
+        stats = self.stats
+        deadline = self.deadline
+        if stats is not None:
+            stats.count('searches')
+        while frontier and target not in parents:
+            depth += 1
+            if stats is not None:
+                stats.count('nodes_expanded', len(frontier))
+                stats.peak('max_frontier', len(frontier))
+            next_frontier = []
+            for square in frontier:
+                if deadline is not None and deadline.expired():
+                    raise OutOfTime((distances, parents))
+                col, row = square
+                for move in self._get_available_moves(
+                        self.piece, col, row, enemies):
+                    if move in parents:
+                        continue
+                    parents[move] = square
+                    distances[move] = depth
+                    if move == target:
+                        return distances, parents
+                    next_frontier.append(move)
+            frontier = next_frontier
+        return distances, parents
+
+    def _search_sliding_distances(self, origin, target, enemies):
+        # _search_distances for sliding pieces on boards other than 8x8.
+        # Walking every ray in full would take time in proportion to the
+        # area times the width, so a ray is dropped where it meets a
+        # square reached in fewer moves, whose own rays already went
+        # further.  Paths are as short as ever, but a tie may be broken
+        # differently.
+        blocked = self.get_blockers(enemies)[0]
+        width, height, grid = self.width, self.height, self.grid
+        steps = [STEPS[d] for d in SLIDING_DIRECTIONS[self.piece]]
+        distances = {origin: 0}
+        parents = {origin: None}
+        frontier = [origin]
+        depth = 0
+        stats = self.stats
+        deadline = self.deadline
+        if stats is not None:
+            stats.count('searches')
+        while frontier and target not in parents:
+            depth += 1
+            if stats is not None:
+                stats.count('nodes_expanded', len(frontier))
+                stats.peak('max_frontier', len(frontier))
+            next_frontier = []
+            for square in frontier:
+                if deadline is not None and deadline.expired():
+                    raise OutOfTime((distances, parents))
+                for dc, dr in steps:
+                    col, row = square[0] + dc, square[1] + dr
+                    while 0 <= col < width and 0 <= row < height:
+                        sq = row * width + col
+                        move = grid[sq]
+                        moves = distances.get(move)
+                        if moves is None:
+                            parents[move] = square
+                            distances[move] = depth
+                            if move == target:
+                                return distances, parents
+                            next_frontier.append(move)
+                        elif moves < depth:
+                            break
+                        if sq in blocked:
+                            break
+                        col, row = col + dc, row + dr
+            frontier = next_frontier
+        return distances, parents
+
+    def get_depth_first_path(self, origin, target, path, seen):
+        # exhaustive search, keeping the shortest path found in self.best
+        self.check_deadline()
+        if self.stats is not None:
+            if not path:
+                self.stats.count('searches')
+            self.stats.count('nodes_expanded')
+            self.stats.peak('max_depth', len(path) + 1)
         path.append(origin)
         seen[origin] = len(path)
         avail = self._get_available_moves(self.piece, *origin)
@@ -323,19 +1710,19 @@ class Board(object):
         if target in avail:
             # potential best solution
             path.append(target)
-            if len(path) < len(self.best):
+            if self.best is None or len(path) < len(self.best):
                 self.best = path[:]
             path.pop()
             path.pop()
         elif avail:
             # go one level deeper
-            if len(self.best) - len(path) == 1:
+            if self.best and len(self.best) - len(path) == 1:
                 path.pop()
                 return
             for move in avail:
                 if move in seen and seen[move] < len(path):
                     continue
-                self.get_shortest_path(move, target, path, seen)
+                self.get_depth_first_path(move, target, path, seen)
             path.pop()
         return self.best
 
@@ -346,8 +1733,8 @@ class Board(object):
         board = ['\n']
         if self.piece != 'KNIGHT':
             piece = self.piece[0]
-        for r in reversed(range(8)):
-            for c in range(8):
+        for r in reversed(range(self.height)):
+            for c in range(self.width):
                 square = self.squares[c][r]
                 if square == FRIENDLY:
                     board.append('[{}]'.format(piece))
@@ -361,12 +1748,12 @@ class Board(object):
 
 class Moves(object):
 
-    def __init__(self, board, col, row, direction, limit=8):
+    def __init__(self, board, col, row, direction, limit=None):
         self.board = board
         self.col = col
         self.row = row
         self.direction = direction
-        self.limit = limit
+        self.limit = limit or max(board.width, board.height)
         self.num_returned = 0
 
     def next(self):
@@ -392,16 +1779,561 @@ class Moves(object):
         return self
 
 
+def get_ray_moves(sq, direction, enemies):
+    # the squares along a ray up to and including the nearest enemy, which
+    # can be captured but not passed
+    ray = RAYS[direction][sq]
+    blockers = RAY_MASKS[direction][sq] & enemies
+    if blockers:
+        if direction in ASCENDING:
+            nearest = (blockers & -blockers).bit_length() - 1
+        else:
+            nearest = blockers.bit_length() - 1
+        ray = ray[:DISTANCE[sq][nearest]]
+    return ray
+
+
+# Lower bounds on the moves a piece needs between two squares, for the A*
+# search.  None means the target can never be reached from the square.
+def king_distance(square, target):
+    return max(abs(square[0] - target[0]), abs(square[1] - target[1]))
+
+
+def knight_distance(square, target):
+    # closed form distance on an unbounded board.  The edges of a real
+    # board only take moves away, so it never overestimates.
+    dx, dy = abs(square[0] - target[0]), abs(square[1] - target[1])
+    if dx < dy:
+        dx, dy = dy, dx
+    if (dx, dy) == (1, 0):
+        return 3
+    if (dx, dy) == (2, 2):
+        return 4
+    delta = dx - dy
+    if dy > delta:
+        return delta - 2 * ((delta - dy) // 3)
+    return delta - 2 * ((delta - dy) // 4)
+
+
+def rook_distance(square, target):
+    if square == target:
+        return 0
+    return 1 if square[0] == target[0] or square[1] == target[1] else 2
+
+
+def bishop_distance(square, target):
+    dx, dy = abs(square[0] - target[0]), abs(square[1] - target[1])
+    if (dx + dy) % 2:
+        # the other color
+        return None
+    if dx == dy:
+        return 1 if dx else 0
+    return 2
+
+
+def queen_distance(square, target):
+    dx, dy = abs(square[0] - target[0]), abs(square[1] - target[1])
+    if not dx and not dy:
+        return 0
+    return 1 if not dx or not dy or dx == dy else 2
+
+
+def pawn_distance(square, target):
+    # one move per rank, less one for the double push off the second
+    # rank.  Each capture moves the pawn one column over as it goes.
+    ranks = target[1] - square[1]
+    if ranks < 0 or abs(target[0] - square[0]) > ranks:
+        return None
+    if square[1] == 1 and ranks >= 2:
+        return ranks - 1
+    return ranks
+
+
+LOWER_BOUNDS = {KING: king_distance, KNIGHT: knight_distance,
+                ROOK: rook_distance, BISHOP: bishop_distance,
+                QUEEN: queen_distance, PAWN: pawn_distance}
+
+
+# pawns are left out as enemies give them extra moves to capture with
+TABLE_PIECES = frozenset([ROOK, KNIGHT, BISHOP, QUEEN, KING])
+
+
+class DistanceTables(object):
+    """
+    Move counts and next hops between every pair of squares on an empty
+    board, for every piece.  data is laid out as the magic header, then a
+    byte per piece, origin and target for the move counts, then the same
+    for the next hops, with NO_SQUARE where there isn't one.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.hops = len(PIECES) * 4096
+
+    def offset(self, piece, origin, target):
+        return (len(DISTANCE_TABLES_MAGIC) + PIECES.index(piece) * 4096 +
+                square_index(*origin) * 64 + square_index(*target))
+
+    def distance(self, piece, origin, target):
+        # None if the target can't be reached
+        moves = ord(self.data[self.offset(piece, origin, target)])
+        return None if moves == NO_SQUARE else moves
+
+    def path(self, piece, origin, target):
+        # [] if the target can't be reached, like get_shortest_path
+        offset = self.offset(piece, origin, target)
+        if ord(self.data[offset]) == NO_SQUARE:
+            return []
+        path = [origin]
+        base = offset - square_index(*origin) * 64 + self.hops
+        while path[-1] != target:
+            hop = ord(self.data[base + square_index(*path[-1]) * 64])
+            path.append(SQUARES[hop])
+        return path
+
+
+def build_distance_tables():
+    # breadth first search from every square of an empty board gives the
+    # move counts.  The next hop towards a target is the first move that
+    # gets one move closer to it, so following next hops gives the same
+    # path as tracing back the search.
+    size = len(PIECES) * 4096
+    distances = bytearray([NO_SQUARE]) * size
+    hops = bytearray([NO_SQUARE]) * size
+    for base, piece in zip(range(0, size, 4096), PIECES):
+        board = Board(piece, 'a2')
+        board.squares = [[EMPTY] * 8 for _ in range(8)]
+        # pawns can't stand on the first row
+        origins = range(8 if piece == PAWN else 0, 64)
+        for origin in origins:
+            found, _ = board._search_distances(SQUARES[origin], None, 0)
+            for square, needed in found.items():
+                distances[base + origin * 64 + square_index(*square)] = needed
+        for origin in origins:
+            moves = [square_index(*move) for move in
+                     board._get_available_moves(piece, *SQUARES[origin])]
+            for target in range(64):
+                needed = distances[base + origin * 64 + target]
+                if needed in (0, NO_SQUARE):
+                    continue
+                for move in moves:
+                    if distances[base + move * 64 + target] == needed - 1:
+                        hops[base + origin * 64 + target] = move
+                        break
+    return DISTANCE_TABLES_MAGIC + bytes(distances + hops)
+
+
+def map_distance_tables(path):
+    # None if the file is missing or isn't a current set of tables
+    size = len(DISTANCE_TABLES_MAGIC) + len(PIECES) * 4096 * 2
+    try:
+        with open(path, 'rb') as fd:
+            data = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+    except (IOError, OSError, ValueError):
+        return None
+    if (len(data) != size or
+            data[:len(DISTANCE_TABLES_MAGIC)] != DISTANCE_TABLES_MAGIC):
+        data.close()
+        return None
+    return data
+
+
+def load_distance_tables(path=DISTANCE_TABLES_PATH):
+    # memory map the tables so that every process using them shares the
+    # same pages.  They're built and saved first if the file is missing
+    # or out of date, or kept in memory if they can't be saved.
+    data = map_distance_tables(path)
+    if data is None:
+        data = build_distance_tables()
+        try:
+            # write to a temporary file first so other processes never
+            # map a half written one
+            temp_path = '{}.{}'.format(path, os.getpid())
+            with open(temp_path, 'wb') as fd:
+                fd.write(data)
+            os.rename(temp_path, path)
+        except (IOError, OSError):
+            pass
+        else:
+            data = map_distance_tables(path) or data
+    return DistanceTables(data)
+
+
+def trace_path(parents, square):
+    # follow parent pointers back to the origin of a search
+    path = []
+    while square is not None:
+        path.append(square)
+        square = parents[square]
+    path.reverse()
+    return path
+
+
+# Collect tours over a matrix of move counts, for when there are too many
+# targets to try every order.  cost[i][j] is the moves from node i to
+# node j, where node 0 is the piece's square and the others are targets,
+# and a tour is a list of the nodes starting with 0.
+def tour_length(cost, tour):
+    return sum(cost[a][b] for a, b in zip(tour, tour[1:]))
+
+
+def nearest_neighbour_tour(cost):
+    tour = [0]
+    remaining = set(range(1, len(cost)))
+    while remaining:
+        row = cost[tour[-1]]
+        nearest = min(remaining, key=lambda j: (row[j], j))
+        tour.append(nearest)
+        remaining.remove(nearest)
+    return tour
+
+
+def farthest_insertion_tour(cost):
+    # adds the target farthest from the tour so far where it adds the
+    # fewest moves, so the overall shape is laid out before the details
+    tour = [0]
+    remaining = set(range(1, len(cost)))
+    nearest = dict((j, cost[0][j]) for j in remaining)
+    while remaining:
+        farthest = max(remaining, key=lambda j: (nearest[j], -j))
+        remaining.remove(farthest)
+        del nearest[farthest]
+        row = cost[farthest]
+        added, position = cost[tour[-1]][farthest], len(tour)
+        for idx in range(1, len(tour)):
+            a, b = tour[idx - 1], tour[idx]
+            if cost[a][farthest] + row[b] - cost[a][b] < added:
+                added, position = cost[a][farthest] + row[b] - cost[a][b], idx
+        tour.insert(position, farthest)
+        for j in remaining:
+            if row[j] < nearest[j]:
+                nearest[j] = row[j]
+    return tour
+
+
+def improve_tour(cost, tour, symmetric=True, neighbours=8, deadline=None):
+    """
+    Shortens a tour in place with 2-opt moves, which reverse a stretch of
+    it, and Or-opt moves, which move a stretch of one to three targets
+    elsewhere, until neither finds anything shorter or the deadline
+    passes.  Only moves that put a target next to one of its nearest
+    neighbours are tried.  Reversing needs the moves between two squares
+    to be the same both ways, so without symmetric only Or-opt moves that
+    keep the direction are made.  Returns the number of moves made.
+    """
+    # the nodes with the fewest moves into each node
+    near = [sorted((j for j in range(len(cost)) if j != i),
+                   key=lambda j: (cost[j][i], j))[:neighbours]
+            for i in range(len(cost))]
+    improvements = 0
+    while ((deadline is None or not deadline.expired()) and
+           ((symmetric and _two_opt_move(cost, tour, near)) or
+            _or_opt_move(cost, tour, near, symmetric))):
+        improvements += 1
+    return improvements
+
+
+def _two_opt_move(cost, tour, near):
+    # makes the first move found that joins a to a neighbour c in place of
+    # its next node b, by reversing the stretch between them
+    last = len(tour) - 1
+    position = dict((node, idx) for idx, node in enumerate(tour))
+    for i in range(1, last + 1):
+        a, b = tour[i - 1], tour[i]
+        for c in near[a]:
+            change = cost[c][a] - cost[a][b]
+            if change >= 0:
+                break
+            j = position[c]
+            if j > i:
+                # a b ... c d becomes a c ... b d
+                if j < last:
+                    d = tour[j + 1]
+                    change += cost[b][d] - cost[c][d]
+                if change < 0:
+                    tour[i:j + 1] = tour[i:j + 1][::-1]
+                    return True
+            elif j < i - 1:
+                # c e ... a b becomes c a ... e b
+                e = tour[j + 1]
+                if change + cost[e][b] - cost[c][e] < 0:
+                    tour[j + 1:i] = tour[j + 1:i][::-1]
+                    return True
+    return False
+
+
+def _or_opt_move(cost, tour, near, symmetric):
+    # makes the first move found that takes out a stretch of the tour and
+    # puts it back right after a neighbour of its first node, or reversed
+    # right before one
+    last = len(tour) - 1
+    position = dict((node, idx) for idx, node in enumerate(tour))
+    for length in (1, 2, 3):
+        for i in range(1, last - length + 2):
+            j = i + length - 1
+            first, end = tour[i], tour[j]
+            saved = cost[tour[i - 1]][first]
+            if j < last:
+                saved += (cost[end][tour[j + 1]] -
+                          cost[tour[i - 1]][tour[j + 1]])
+            for c in near[first]:
+                k = position[c]
+                places = []
+                if not i - 1 <= k <= j:
+                    places.append((k, c, tour[k + 1] if k < last else None,
+                                   first, end))
+                if symmetric and k and not i <= k <= j + 1:
+                    places.append((k - 1, tour[k - 1], c, end, first))
+                for after, x, y, start, finish in places:
+                    added = cost[x][start]
+                    if y is not None:
+                        added += cost[finish][y] - cost[x][y]
+                    if added < saved:
+                        stretch = tour[i:j + 1]
+                        if start != first:
+                            stretch.reverse()
+                        del tour[i:j + 1]
+                        if after > j:
+                            after -= length
+                        tour[after + 1:after + 1] = stretch
+                        return True
+    return False
+
+
+def tour_lower_bound(cost, symmetric=True):
+    # no tour is shorter than a minimum spanning tree of its nodes, or
+    # without symmetric costs, than the fewest moves into every target
+    if not symmetric:
+        return sum(min(cost[i][j] for i in range(len(cost)) if i != j)
+                   for j in range(1, len(cost)))
+    total = 0
+    nearest = dict((j, cost[0][j]) for j in range(1, len(cost)))
+    while nearest:
+        j = min(nearest, key=nearest.get)
+        total += nearest.pop(j)
+        for k in nearest:
+            if cost[j][k] < nearest[k]:
+                nearest[k] = cost[j][k]
+    return total
+
+
+# The ways of turning or flipping a board onto itself, as whether to swap
+# cols with rows, then whether to mirror the cols and the rows.  Swapping
+# only fits square boards, and pawns only move up the board, so they can
+# only be mirrored left to right.
+SYMMETRIES = [(swap, flip_cols, flip_rows) for swap in (False, True)
+              for flip_cols in (False, True) for flip_rows in (False, True)]
+PAWN_SYMMETRIES = [(False, False, False), (False, True, False)]
+
+
+def get_symmetries(piece, width, height):
+    if piece == PAWN:
+        return PAWN_SYMMETRIES
+    return [symmetry for symmetry in SYMMETRIES
+            if width == height or not symmetry[0]]
+
+
+def transform(square, symmetry, width, height):
+    col, row = square
+    swap, flip_cols, flip_rows = symmetry
+    if swap:
+        col, row = row, col
+    if flip_cols:
+        col = width - 1 - col
+    if flip_rows:
+        row = height - 1 - row
+    return col, row
+
+
+def untransform(square, symmetry, width, height):
+    col, row = square
+    swap, flip_cols, flip_rows = symmetry
+    if flip_cols:
+        col = width - 1 - col
+    if flip_rows:
+        row = height - 1 - row
+    if swap:
+        col, row = row, col
+    return col, row
+
+
+class SymmetryCache(object):
+    """
+    Answers that are shared by every board that's a turned or mirrored
+    copy of another.  A query is answered on the board's canonical copy,
+    the one of its images with the lowest origin and enemies, and the
+    answer is turned back to fit the board, so all the images of a board
+    share one entry and get the same answer whether it was cached or not.
+    Answers are kept in an LRUCache of maxsize unless results is given
+    another mapping to keep them in, such as a store.SolutionStore.
+    """
+
+    def __init__(self, maxsize=RESULT_CACHE_SIZE, results=None):
+        self.results = LRUCache(maxsize) if results is None else results
+
+    def canonical(self, board):
+        # the symmetry that makes the canonical copy of the board, with
+        # the copy's origin square number and enemy bitboard
+        width, height = board.width, board.height
+        images = []
+        for symmetry in get_symmetries(board.piece, width, height):
+            col, row = transform((board.col, board.row), symmetry,
+                                 width, height)
+            enemy_bits = 0
+            for target in board.targets:
+                enemy_col, enemy_row = transform(target, symmetry, width,
+                                                 height)
+                enemy_bits |= 1 << enemy_row * width + enemy_col
+            images.append((row * width + col, enemy_bits, symmetry))
+        origin, enemy_bits, symmetry = min(images)
+        return symmetry, origin, enemy_bits
+
+    def solve(self, board, query, exact=False, improve=None):
+        # the board's answer to a MOVES, TARGET or COLLECT query
+        symmetry, origin, enemy_bits = self.canonical(board)
+        key = (query, board.piece, board.width, board.height, board.search,
+               exact, improve, origin, enemy_bits)
+        result = self.results.get(key)
+        if result is None:
+            copy = Board.from_bits(board.piece, origin, enemy_bits,
+                                   board.width, board.height, board.search,
+                                   board.stats)
+            if query == TARGET:
+                result = copy.get_fewest_moves_to_farthest_target()
+            elif query == COLLECT:
+                result = copy.get_fewest_moves_to_all_targets(
+                    exact=exact, improve=improve)
+            else:
+                result = copy.get_available_moves()
+            # the copy's enemies are given rather than placed at random,
+            # so its answer is always for this layout
+            self.results[key] = result
+        if query == TARGET and not result and board.random_enemies:
+            # the piece can't reach any of the enemies placed at random, so
+            # the board sets up others just as it would without a cache.
+            # That answer is for some other layout, so it isn't kept.
+            return board.get_fewest_moves_to_farthest_target()
+        if not isinstance(result, list):
+            return result
+        return self.turn_back(result, symmetry, board.width, board.height)
+
+    def turn_back(self, result, symmetry, width, height):
+        # the squares of an answer on the canonical copy, on the board.
+        # Collect answers are lists of legs, the others lists of squares.
+        return [self.turn_back(item, symmetry, width, height)
+                if isinstance(item, list) else
+                to_algebraic(*untransform(from_algebraic(item), symmetry,
+                                          width, height))
+                for item in result]
+
+    def clear(self):
+        self.results.clear()
+
+    def stats(self):
+        return self.results.stats()
+
+
+def solve(query, piece, position, enemies=None, exact=False, width=8,
+          height=8, enemy_count=None, improve=None, time_limit=None,
+          cache=None):
+    # answer one MOVES, TARGET or COLLECT query on a fresh board.  Without
+    # a list of enemies, TARGET and COLLECT place enemy_count of them at
+    # random just like the command line does.  With a time_limit in
+    # seconds the answer is a Solution.  A SymmetryCache answers queries
+    # without a time_limit, which are always complete.
+    if query not in QUERIES:
+        raise ValueError('{} is not a query, choose from {}.'.format(
+            query, ', '.join(QUERIES)))
+    if piece not in PIECES:
+        raise ValueError('{} is not a piece, choose from {}.'.format(
+            piece, ', '.join(PIECES)))
+    board = Board(piece, position, place_enemies=query != MOVES,
+                  enemies=enemies, width=width, height=height,
+                  enemy_count=enemy_count)
+    if cache is not None and time_limit is None:
+        return cache.solve(board, query, exact, improve)
+    deadline = None if time_limit is None else Deadline(time_limit)
+    if query == TARGET:
+        return board.get_fewest_moves_to_farthest_target(deadline)
+    elif query == COLLECT:
+        return board.get_fewest_moves_to_all_targets(
+            exact=exact, improve=improve, deadline=deadline)
+    moves = board.get_available_moves()
+    return moves if deadline is None else Solution(moves, True)
+
+
+def answer(request, cache=None):
+    # answer a query given as a dict of solve's arguments, e.g. one
+    # decoded from JSON.  Returns a dict with the result, or the error if
+    # it couldn't be answered, plus the request's id if it has one.  Any
+    # error is answered, so one bad request never stops those after it.
+    # cache is an optional SymmetryCache, see solve.
+    response = {}
+    if 'id' in request:
+        response['id'] = request['id']
+    try:
+        result = solve(
+            request.get('query', MOVES), request['piece'],
+            request['position'], request.get('enemies'),
+            request.get('exact', False), request.get('width', 8),
+            request.get('height', 8), request.get('enemy_count'),
+            request.get('improve'), request.get('time_limit'), cache)
+        if isinstance(result, Solution):
+            response['result'], response['optimal'] = result
+        else:
+            response['result'] = result
+    except Exception as e:
+        response['error'] = '{}: {}'.format(type(e).__name__, e)
+    return response
+
+
+def answer_lines(lines, cache=None):
+    # answer requests given as JSON objects, one per line, yielding a line
+    # of JSON with each response as soon as it's ready.  Blank lines are
+    # skipped.
+    for line in lines:
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+        except ValueError:
+            request = None
+        if isinstance(request, dict):
+            response = answer(request, cache)
+        else:
+            response = {'error': 'ValueError: not a JSON request'}
+        yield json.dumps(response) + '\n'
+
+
 # helper functions for switching back and forth
-# between algebraic notation and col, row format
+# between algebraic notation and col, row format.  Boards wider than 26
+# columns carry on from z with aa, ab and so on, like a spreadsheet, and
+# rows are numbered from 1 however many there are, e.g. ab100.
 def from_algebraic(position):
-    col = COLS_REVERSE[position[0]]
-    row = int(position[1]) - 1
-    return col, row
+    digits = position.lstrip(LETTERS)
+    letters = position[:len(position) - len(digits)]
+    if not letters or not digits.isdigit():
+        raise ValueError('{} is not a square.'.format(position))
+    col = 0
+    for letter in letters:
+        col = col * 26 + COLS_REVERSE[letter] + 1
+    return col - 1, int(digits) - 1
+
+
+def column_name(col):
+    name = ''
+    col += 1
+    while col:
+        col, letter = divmod(col - 1, 26)
+        name = LETTERS[letter] + name
+    return name
 
 
 def to_algebraic(col, row):
-    return '{}{}'.format(COLS[col], row + 1)
+    return '{}{}'.format(COLS.get(col) or column_name(col), row + 1)
+
+
+DISTANCE_TABLES = load_distance_tables()
 
 
 if __name__ == "__main__":
@@ -416,24 +2348,102 @@ if __name__ == "__main__":
     parser.add_argument('--collect',
                         help=('show minimum moves required to caputre '
                               'all enemy piece'), action='store_true')
+    parser.add_argument('--exact',
+                        help=('with --collect, find the shortest tour '
+                              'instead of an approximate one'),
+                        action='store_true')
+    parser.add_argument('--improve',
+                        help=('with --collect, improve on an approximate '
+                              'tour, the default for more than {} enemies '
+                              'but for rooks, bishops and '
+                              'queens'.format(IMPROVE_TOUR_TARGETS)),
+                        action='store_true', default=None)
+    parser.add_argument('--stream',
+                        help=('with --collect, print each leg and the '
+                              'moves so far as soon as the leg is found'),
+                        action='store_true')
+    parser.add_argument('--enemies',
+                        help='number of enemies to place at random',
+                        type=int, default=None)
+    parser.add_argument('--time_limit',
+                        help=('seconds to spend before settling for the '
+                              'best answer found so far'),
+                        type=float, default=None)
+    parser.add_argument('--width', help='number of columns on the board',
+                        type=int, default=8)
+    parser.add_argument('--height', help='number of rows on the board',
+                        type=int, default=8)
+    parser.add_argument('--batch',
+                        help=('answer JSON requests read one per line from '
+                              'stdin, writing a JSON response per line to '
+                              'stdout, see server.py for the format'),
+                        action='store_true')
+    parser.add_argument('--cache_size',
+                        help=('with --batch, number of answers to keep in '
+                              'memory for turned or mirrored boards'),
+                        type=int, default=0)
+    parser.add_argument('--store',
+                        help=('file to keep answers in and look them up '
+                              'from, shared with other runs'))
+    parser.add_argument('--store_size',
+                        help='number of answers the store keeps',
+                        type=int, default=None)
     parser.add_argument('--show_board',
                         help=('show board positions' 'show_board'),
                         action='store_true')
     args = parser.parse_args()
+    if args.batch:
+        cache = None
+        if args.store:
+            cache = SymmetryCache(results=store.SolutionStore(
+                args.store, args.store_size or store.MAX_ENTRIES))
+        elif args.cache_size:
+            cache = SymmetryCache(args.cache_size)
+        # stdout is only flushed when its buffer fills, and at the end
+        write = sys.stdout.write
+        for line in answer_lines(sys.stdin, cache):
+            write(line)
+        sys.stdout.flush()
+        sys.exit()
     enemies = args.collect or args.target
     if args.collect and args.target:
         print 'Choose target or collect but not both.'
         sys.exit()
+    if args.collect and args.stream and args.store:
+        # streamed legs are printed as they're found, never stored
+        print 'Choose stream or store but not both.'
+        sys.exit()
     if args.collect:
         if args.piece in [PAWN, BISHOP]:
             print ("{}s can't cover all squares, so they're not allowed"
                    " with the --collect option".format(args.piece))
             sys.exit()
     board = Board(args.piece, args.position, place_enemies=enemies,
-                  show=args.show_board)
-    if args.target:
-        print board.get_fewest_moves_to_farthest_target()
+                  show=args.show_board, width=args.width, height=args.height,
+                  enemy_count=args.enemies)
+    query = TARGET if args.target else COLLECT if args.collect else MOVES
+    deadline = None
+    if args.time_limit is not None:
+        deadline = Deadline(args.time_limit)
+    if args.store and deadline is None:
+        results = store.SolutionStore(args.store,
+                                      args.store_size or store.MAX_ENTRIES)
+        result = SymmetryCache(results=results).solve(
+            board, query, args.exact, args.improve)
+    elif args.collect and args.stream:
+        result = None
+        for leg in board.iter_legs(args.exact, args.improve, deadline):
+            print leg.moves, leg.total
+            sys.stdout.flush()
+    elif args.target:
+        result = board.get_fewest_moves_to_farthest_target(deadline)
     elif args.collect:
-        print board.get_fewest_moves_to_all_targets()
+        result = board.get_fewest_moves_to_all_targets(
+            exact=args.exact, improve=args.improve, deadline=deadline)
     else:
-        print board.get_available_moves()
+        result = board.get_available_moves()
+    if isinstance(result, Solution):
+        print result.moves
+        print 'optimal' if result.optimal else 'not proven optimal'
+    elif result is not None:
+        print result
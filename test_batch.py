@@ -0,0 +1,78 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests for batch.py
+"""
+from __future__ import absolute_import
+
+import random
+import unittest
+
+import tasks
+
+try:
+    import numpy as np
+    import batch
+except ImportError:
+    np = None
+
+PIECES = [tasks.PAWN, tasks.ROOK, tasks.KNIGHT,
+          tasks.BISHOP, tasks.QUEEN, tasks.KING]
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestBatch(unittest.TestCase):
+
+    def get_boards(self, count):
+        rng = random.Random(0)
+        boards = []
+        for idx in range(count):
+            piece = PIECES[idx % len(PIECES)]
+            col, row = rng.randrange(8), rng.randrange(1, 8)
+            board = tasks.Board(piece, tasks.to_algebraic(col, row))
+            for _ in range(rng.randrange(16)):
+                c, r = rng.randrange(8), rng.randrange(8)
+                if board.squares[c][r] == tasks.EMPTY:
+                    board.squares[c][r] = tasks.ENEMY
+            boards.append(board)
+        return boards
+
+    def test_available_moves_match_board(self):
+        boards = self.get_boards(60)
+        pieces = [board.piece for board in boards]
+        origins = [(board.col, board.row) for board in boards]
+
+        moves = batch.get_available_moves(
+            pieces, origins, batch.to_occupancy(boards))
+
+        for board, board_moves in zip(boards, moves):
+            expected = board._get_available_moves(
+                board.piece, board.col, board.row)
+            self.assertItemsEqual(zip(*np.nonzero(board_moves)), expected)
+
+    def test_distances_match_board(self):
+        boards = self.get_boards(60)
+        pieces = [board.piece for board in boards]
+        origins = [(board.col, board.row) for board in boards]
+
+        distances = batch.get_distances(
+            pieces, origins, batch.to_occupancy(boards))
+
+        for board, board_distances in zip(boards, distances):
+            expected, _ = board.get_distance_map((board.col, board.row))
+            reached = dict(((c, r), board_distances[c, r])
+                           for c, r in zip(*np.nonzero(board_distances >= 0)))
+            self.assertEqual(reached, expected)
+
+    def test_pawn_on_first_row(self):
+        occupancy = np.zeros((1, 8, 8), dtype=np.uint8)
+
+        self.assertRaises(tasks.IllegalPositionError,
+                          batch.get_available_moves,
+                          [tasks.PAWN], [(0, 0)], occupancy)
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests for bench.py
+"""
+from __future__ import absolute_import
+
+import random
+import unittest
+
+import bench
+import tasks
+
+
+class TestBench(unittest.TestCase):
+
+    def test_layouts_are_seeded(self):
+        first = bench.get_layouts(random.Random(3), 5, bench.PIECES)
+        again = bench.get_layouts(random.Random(3), 5, bench.PIECES)
+
+        self.assertEqual([b.targets for b in first],
+                         [b.targets for b in again])
+        self.assertTrue(all(len(b.targets) == 8 for b in first))
+
+    def test_pawns_start_above_first_row(self):
+        boards = bench.get_layouts(random.Random(0), 50, [tasks.PAWN])
+
+        self.assertTrue(all(board.row > 0 for board in boards))
+
+    def test_run_benchmarks(self):
+        results = bench.run_benchmarks(
+            ['moves_knight', 'collect_greedy'], count=2, repeat=1)
+
+        self.assertEqual(list(results), ['moves_knight', 'collect_greedy'])
+        self.assertEqual(results['moves_knight']['ops'], 128)
+        self.assertEqual(results['collect_greedy']['ops'], 2)
+        for result in results.values():
+            self.assertTrue(result['p50_us'] <= result['p99_us'])
+            self.assertTrue(result['ops_per_sec'] > 0)
+
+    def test_peaks_are_per_benchmark(self):
+        # memory the process used before isn't counted as the benchmark's
+        hungry = ' ' * (64 << 20)
+        del hungry
+
+        results = bench.run_benchmarks(['moves_knight'], count=1, repeat=1)
+
+        self.assertLess(results['moves_knight']['peak_kb'], 32 << 10)
+        self.assertEqual(list(results['moves_knight']),
+                         ['ops', 'ops_per_sec', 'p50_us', 'p90_us',
+                          'p99_us', 'peak_kb'])
+
+    def test_compare_finds_regressions(self):
+        baseline = {'fast': {'p50_us': 10.0}, 'slow': {'p50_us': 10.0}}
+        results = {'fast': {'p50_us': 10.5}, 'slow': {'p50_us': 12.0},
+                   'new': {'p50_us': 1.0}}
+
+        self.assertEqual(bench.compare(results, baseline), ['slow'])
@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests for parallel.py
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import parallel
+import store
+import tasks
+
+ENEMIES = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+QUERIES = [
+    (tasks.MOVES, tasks.KNIGHT, 'a1'),
+    (tasks.MOVES, tasks.PAWN, 'a2', ['b3']),
+    (tasks.TARGET, tasks.QUEEN, 'h2', ENEMIES),
+    (tasks.COLLECT, tasks.KING, 'h2', ENEMIES),
+    (tasks.COLLECT, tasks.KNIGHT, 'h2', ENEMIES, True),
+] * 4
+
+
+class TestRunQueries(unittest.TestCase):
+
+    def test_ordered_results_match_serial(self):
+        expected = [tasks.solve(*query) for query in QUERIES]
+
+        results = list(parallel.run_queries(QUERIES, processes=2,
+                                            chunksize=3))
+
+        self.assertEqual(results, list(enumerate(expected)))
+
+    def test_unordered_results_cover_every_query(self):
+        expected = [tasks.solve(*query) for query in QUERIES]
+
+        results = parallel.run_queries(QUERIES, processes=2, chunksize=3,
+                                       ordered=False)
+
+        self.assertEqual(sorted(results), list(enumerate(expected)))
+
+    def test_errors_are_raised(self):
+        queries = [(tasks.MOVES, tasks.PAWN, 'a1')]
+
+        results = parallel.run_queries(queries, processes=1)
+
+        self.assertRaises(tasks.IllegalPositionError, list, results)
+
+    def test_shared_store(self):
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, 'solutions.db')
+        try:
+            first = list(parallel.run_queries(QUERIES, processes=2,
+                                              chunksize=3, store_path=path))
+            second = list(parallel.run_queries(QUERIES, processes=2,
+                                               chunksize=3, store_path=path))
+            stored = len(store.SolutionStore(path))
+        finally:
+            shutil.rmtree(directory)
+
+        self.assertEqual(first, second)
+        self.assertEqual(stored, 5)
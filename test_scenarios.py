@@ -0,0 +1,113 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests for scenarios.py
+"""
+from __future__ import absolute_import
+
+import unittest
+
+import tasks
+
+try:
+    import numpy as np
+    import scenarios
+except ImportError:
+    np = None
+
+PIECES = [tasks.PAWN, tasks.ROOK, tasks.KNIGHT,
+          tasks.BISHOP, tasks.QUEEN, tasks.KING]
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class TestScenarios(unittest.TestCase):
+
+    def check_scenarios(self, origins, enemies, area):
+        self.assertTrue(((enemies >= 0) & (enemies < area)).all())
+        ordered = np.sort(np.hstack([origins[:, None], enemies]), axis=1)
+        self.assertFalse((ordered[:, 1:] == ordered[:, :-1]).any())
+
+    def test_same_seed_same_scenarios(self):
+        first = scenarios.generate(tasks.QUEEN, 100, seed=7)
+        second = scenarios.generate(tasks.QUEEN, 100, seed=7)
+        other = scenarios.generate(tasks.QUEEN, 100, seed=8)
+        for made, again in zip(first, second):
+            self.assertTrue((made == again).all())
+        self.assertFalse((first[1] == other[1]).all())
+
+    def test_enemies_are_distinct_and_off_the_piece(self):
+        for piece in PIECES:
+            origins, enemies = scenarios.generate(piece, 500, seed=1)
+            self.assertEqual(origins.shape, (500,))
+            self.assertEqual(enemies.shape, (500, tasks.ENEMY_COUNT))
+            self.check_scenarios(origins, enemies, 64)
+
+    def test_pawns_never_start_on_the_first_row(self):
+        origins, _ = scenarios.generate(tasks.PAWN, 500, seed=1)
+        self.assertTrue((origins >= 8).all())
+        origins, _ = scenarios.generate(tasks.PAWN, 500, seed=1,
+                                        reachable=True)
+        self.assertTrue(((origins >= 8) & (origins < 56)).all())
+
+    def test_full_board(self):
+        origins, enemies = scenarios.generate(tasks.KING, 20, 63, seed=1)
+        self.check_scenarios(origins, enemies, 64)
+        self.assertRaises(ValueError, scenarios.generate, tasks.KING, 20, 64)
+
+    def test_reachable_target(self):
+        sizes = [(8, 8), (3, 3), (2, 7), (5, 3), (3, 4)]
+        for piece in PIECES:
+            for width, height in sizes:
+                origins, enemies = scenarios.generate(
+                    piece, 100, 4, seed=3, width=width, height=height,
+                    reachable=True)
+                self.check_scenarios(origins, enemies, width * height)
+                for board in scenarios.iter_boards(piece, origins, enemies,
+                                                   width, height):
+                    self.assertIn(board.get_farthest_target(),
+                                  board.targets)
+
+    def test_first_enemy_is_reachable(self):
+        for piece in [tasks.PAWN, tasks.BISHOP, tasks.KNIGHT]:
+            origins, enemies = scenarios.generate(
+                piece, 200, seed=4, width=5, height=6, reachable=True)
+            for board, squares in zip(
+                    scenarios.iter_boards(piece, origins, enemies, 5, 6),
+                    enemies):
+                distances, _ = board.get_distance_map((board.col, board.row))
+                self.assertIn(board.grid[squares[0]], distances)
+
+    def test_nothing_to_reach(self):
+        self.assertRaises(ValueError, scenarios.generate, tasks.BISHOP, 10,
+                          width=1, height=8, reachable=True)
+        self.assertRaises(ValueError, scenarios.generate, tasks.PAWN, 10,
+                          width=8, height=1)
+
+    def test_big_boards(self):
+        origins, enemies = scenarios.generate(
+            tasks.ROOK, 1000, 20, seed=5, width=512, height=512,
+            reachable=True)
+        self.check_scenarios(origins, enemies, 512 * 512)
+
+    def test_bitboards_match_boards(self):
+        origins, enemies = scenarios.generate(tasks.KNIGHT, 50, seed=6)
+        enemy_bits, occupied_bits = scenarios.to_bitboards(origins, enemies)
+        boards = scenarios.iter_boards(tasks.KNIGHT, origins, enemies)
+        for idx, board in enumerate(boards):
+            expected = tasks.Board(
+                tasks.KNIGHT, board.position,
+                enemies=[tasks.to_algebraic(*tasks.SQUARES[sq])
+                         for sq in enemies[idx]])
+            self.assertEqual(board.enemy_bits, expected.enemy_bits)
+            self.assertEqual(board.occupied_bits, expected.occupied_bits)
+            self.assertEqual(board.targets, expected.targets)
+            self.assertEqual(int(enemy_bits[idx]), expected.enemy_bits)
+            self.assertEqual(int(occupied_bits[idx]), expected.occupied_bits)
+            self.assertEqual(board.get_farthest_target(),
+                             expected.get_farthest_target())
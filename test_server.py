@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests for server.py
+"""
+from __future__ import absolute_import
+
+import json
+import threading
+import unittest
+
+import server
+import tasks
+
+ENEMIES = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+
+
+class TestServer(unittest.TestCase):
+
+    def setUp(self):
+        self.server = server.make_server(port=0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.start()
+        self.client = server.Client(*self.server.server_address)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def test_query(self):
+        response = self.client.query(tasks.MOVES, tasks.KNIGHT, 'a1')
+
+        self.assertEqual(response['id'], 0)
+        self.assertItemsEqual(response['result'], ['b3', 'c2'])
+
+    def test_pipeline_keeps_order(self):
+        queries = [
+            (tasks.COLLECT, tasks.KING, 'h2', ENEMIES),
+            (tasks.MOVES, tasks.ROOK, 'a1', ['a2', 'b1']),
+            (tasks.TARGET, tasks.QUEEN, 'h2', ENEMIES),
+        ]
+
+        responses = self.client.pipeline(queries)
+
+        self.assertEqual([r['id'] for r in responses], [0, 1, 2])
+        self.assertEqual([r['result'] for r in responses],
+                         [tasks.solve(*query) for query in queries])
+
+    def test_errors_are_returned(self):
+        response = self.client.query(tasks.MOVES, tasks.PAWN, 'a1')
+
+        self.assertTrue(response['error'].startswith('IllegalPositionError'))
+
+    def test_bad_requests_keep_the_connection(self):
+        queries = [
+            (tasks.COLLECT, tasks.BISHOP, 'a1', ['a2', 'b2']),
+            (tasks.TARGET, tasks.PAWN, 'c8'),
+            (tasks.TARGET, 'rook', 'a1'),
+            (tasks.MOVES, tasks.KNIGHT, 'a1'),
+        ]
+        self.client.sock.sendall(b'\xff\xfe\n')
+
+        responses = [json.loads(self.client.rfile.readline())]
+        responses.extend(self.client.pipeline(queries))
+
+        self.assertEqual(responses[0],
+                         {'error': 'ValueError: not a JSON request'})
+        self.assertTrue(responses[1]['error'].startswith(
+            'NoPathToTargetError'))
+        self.assertEqual(responses[2]['result'], [])
+        self.assertTrue(responses[3]['error'].startswith('ValueError'))
+        self.assertItemsEqual(responses[4]['result'], ['b3', 'c2'])
+
+    def test_every_argument_is_sent(self):
+        enemies = ['z26', 'b2']
+        path = tasks.solve(tasks.TARGET, tasks.ROOK, 'a1', enemies,
+                           width=26, height=26)
+
+        by_name = self.client.query(tasks.TARGET, tasks.ROOK, 'a1', enemies,
+                                    width=26, height=26)
+        in_order = self.client.pipeline([
+            (tasks.TARGET, tasks.ROOK, 'a1', enemies, False, 26, 26, None,
+             None, 60)])[0]
+
+        self.assertEqual(by_name['result'], path)
+        self.assertEqual(in_order['result'], path)
+        self.assertTrue(in_order['optimal'])
+
+    def test_bad_arguments_are_not_sent(self):
+        self.assertRaises(TypeError, self.client.query, tasks.MOVES,
+                          tasks.KNIGHT, 'a1', None, False, 8, 8, None, None,
+                          None, 'extra')
+        self.assertRaises(TypeError, self.client.query, tasks.MOVES,
+                          tasks.KNIGHT, 'a1', colour='white')
+        self.assertRaises(TypeError, self.client.query, tasks.MOVES,
+                          tasks.KNIGHT, 'a1', None, enemies=[])
+
+    def test_concurrent_clients(self):
+        other = server.Client(*self.server.server_address)
+        try:
+            first = other.query(tasks.MOVES, tasks.KING, 'a1')
+            second = self.client.query(tasks.MOVES, tasks.KING, 'a1')
+        finally:
+            other.close()
+
+        self.assertEqual(first['result'], second['result'])
+
+    def test_cache(self):
+        cached = server.make_server(port=0, cache_size=16)
+        thread = threading.Thread(target=cached.serve_forever)
+        thread.start()
+        client = server.Client(*cached.server_address)
+        try:
+            first = client.query(tasks.MOVES, tasks.KNIGHT, 'a1')
+            second = client.query(tasks.MOVES, tasks.KNIGHT, 'h8')
+        finally:
+            client.close()
+            cached.shutdown()
+            cached.server_close()
+            thread.join()
+
+        self.assertItemsEqual(first['result'], ['b3', 'c2'])
+        self.assertItemsEqual(second['result'], ['g6', 'f7'])
+        self.assertEqual(cached.cache.stats()['hits'], 1)
+        self.assertIsNone(self.server.cache)
@@ -0,0 +1,133 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim:fenc=utf-8
+#
+# Copyright © 2016 Danny Tamez <zematynnad@gmail.com>
+#
+# Distributed under terms of the MIT license.
+
+"""
+Tests for store.py
+"""
+from __future__ import absolute_import
+
+import itertools
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import store
+import tasks
+
+
+class Clock(object):
+    # a time that moves on by a second every time it's read
+
+    def __init__(self):
+        self.ticks = itertools.count()
+
+    def time(self):
+        return float(next(self.ticks))
+
+
+class TestSolutionStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'solutions.db')
+        self.time = store.time
+        store.time = Clock()
+
+    def tearDown(self):
+        store.time = self.time
+        shutil.rmtree(self.directory)
+
+    def test_get_and_set(self):
+        solutions = store.SolutionStore(self.path)
+        key = (tasks.TARGET, tasks.ROOK, 8, 8, 27, 1 << 63)
+
+        self.assertIsNone(solutions.get(key))
+        solutions[key] = ['d4', 'h8']
+
+        self.assertEqual(solutions.get(key), ['d4', 'h8'])
+        self.assertIn(key, solutions)
+        self.assertEqual(len(solutions), 1)
+        stats = solutions.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_answers_outlive_the_store(self):
+        solutions = store.SolutionStore(self.path)
+        solutions['key'] = [['a1'], ['b2', 'c3']]
+        solutions.close()
+
+        self.assertEqual(store.SolutionStore(self.path).get('key'),
+                         [['a1'], ['b2', 'c3']])
+
+    def test_least_recently_used_are_dropped(self):
+        solutions = store.SolutionStore(self.path, max_entries=3)
+        for key in range(5):
+            solutions[key] = key
+        solutions.get(0)
+
+        solutions.trim()
+
+        self.assertEqual(len(solutions), 3)
+        self.assertEqual([key for key in range(5) if key in solutions],
+                         [0, 3, 4])
+        self.assertEqual(solutions.stats()['evictions'], 2)
+
+    def test_uses_are_written_in_batches(self):
+        solutions = store.SolutionStore(self.path)
+        solutions['key'] = 'answer'
+        reader = sqlite3.connect(self.path)
+
+        def used():
+            return reader.execute('SELECT used FROM solutions').fetchone()[0]
+
+        written = used()
+        for _ in range(store.TOUCH_EVERY - 1):
+            solutions.get('key')
+        self.assertEqual(used(), written)
+        solutions.get('key')
+        self.assertGreater(used(), written)
+        reader.close()
+
+    def test_trimmed_as_it_grows(self):
+        solutions = store.SolutionStore(self.path, max_entries=10)
+        for key in range(store.TRIM_EVERY):
+            solutions[key] = key
+
+        self.assertEqual(len(solutions), 10)
+
+    def test_threads(self):
+        solutions = store.SolutionStore(self.path)
+
+        def write(start):
+            for key in range(start, start + 50):
+                solutions[key] = key
+
+        threads = [threading.Thread(target=write, args=(start,))
+                   for start in range(0, 200, 50)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(solutions), 200)
+
+    def test_symmetry_cache(self):
+        cache = tasks.SymmetryCache(results=store.SolutionStore(self.path))
+        first = tasks.solve(tasks.TARGET, tasks.ROOK, 'a1', ['a4', 'b2'],
+                            cache=cache)
+        cache = tasks.SymmetryCache(results=store.SolutionStore(self.path))
+
+        second = tasks.solve(tasks.TARGET, tasks.ROOK, 'h8', ['h5', 'g7'],
+                             cache=cache)
+
+        self.assertEqual(second, [tasks.to_algebraic(*tasks.transform(
+            tasks.from_algebraic(square), (False, True, True), 8, 8))
+            for square in first])
+        self.assertEqual(cache.stats()['hits'], 1)
@@ -11,6 +11,16 @@ Tests for tasks.py
 """
 from __future__ import absolute_import
 
+import json
+import mmap
+import os
+import pickle
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
 import unittest
 
 import tasks
@@ -601,3 +611,1438 @@ class TestMovesWithEnemies(unittest.TestCase):
             ['a8'],
             ['c8', 'e6']]
         self.assertEqual(moves, expected)
+
+
+class TestBitboardMoves(unittest.TestCase):
+
+    def assertSameMoves(self, piece, rows=range(8)):
+        rng = random.Random(0)
+        for _ in range(20):
+            board = tasks.Board(piece, 'a1')
+            for _ in range(rng.randrange(12)):
+                board.squares[rng.randrange(8)][rng.randrange(8)] = (
+                    tasks.ENEMY)
+            for col in range(8):
+                for row in rows:
+                    expected = board._walk_available_moves(piece, col, row)
+                    moves = board._get_available_moves(piece, col, row)
+                    self.assertEqual(list(moves), expected)
+
+    def test_rook_moves_match_walked_moves(self):
+        self.assertSameMoves(tasks.ROOK)
+
+    def test_bishop_moves_match_walked_moves(self):
+        self.assertSameMoves(tasks.BISHOP)
+
+    def test_queen_moves_match_walked_moves(self):
+        self.assertSameMoves(tasks.QUEEN)
+
+    def test_king_moves_match_walked_moves(self):
+        self.assertSameMoves(tasks.KING)
+
+    def test_knight_moves_match_walked_moves(self):
+        self.assertSameMoves(tasks.KNIGHT)
+
+    def test_pawn_moves_match_walked_moves(self):
+        self.assertSameMoves(tasks.PAWN, range(1, 8))
+
+    def test_pawn_blocked_on_first_push(self):
+        board = tasks.Board(tasks.PAWN, 'a2')
+        board.squares[A][THREE] = tasks.ENEMY
+
+        moves = board.get_available_moves()
+
+        self.assertEqual(moves, 'No moves are available.')
+
+    def test_occupancy_follows_squares(self):
+        board = tasks.Board(tasks.ROOK, 'a1')
+        board.squares[D][FOUR] = tasks.ENEMY
+        board.squares[D][FOUR] = tasks.EMPTY
+        board.squares[B][TWO] = tasks.ENEMY
+
+        self.assertEqual(board.enemy_bits, 1 << tasks.square_index(B, TWO))
+        self.assertEqual(board.occupied_bits, board.enemy_bits | 1)
+
+
+class TestShortestPathSearches(unittest.TestCase):
+
+    def get_random_board(self, piece, seed):
+        rng = random.Random(seed)
+        board = tasks.Board(piece, 'd4')
+        for _ in range(8):
+            col, row = rng.randrange(8), rng.randrange(8)
+            if board.squares[col][row] == tasks.EMPTY:
+                board.squares[col][row] = tasks.ENEMY
+        return board
+
+    def assertSearchesAgree(self, piece):
+        for seed in range(5):
+            board = self.get_random_board(piece, seed)
+            origin = tasks.from_algebraic('d4')
+            for target in [(c, r) for c in range(8) for r in range(8)
+                           if board.squares[c][r] == tasks.ENEMY]:
+                board.best = None
+                dfs = board.get_shortest_path(origin, target,
+                                              search=tasks.DFS)
+                bfs = board.get_shortest_path(origin, target)
+                self.assertEqual(len(bfs), len(dfs))
+
+    def test_knight_searches_agree(self):
+        self.assertSearchesAgree(tasks.KNIGHT)
+
+    def test_rook_searches_agree(self):
+        self.assertSearchesAgree(tasks.ROOK)
+
+    def test_breadth_first_path_unreachable(self):
+        board = tasks.Board(tasks.BISHOP, 'a1')
+        target = tasks.from_algebraic('a2')
+        board.squares[A][TWO] = tasks.ENEMY
+
+        path = board.get_shortest_path((A, ONE), target)
+
+        self.assertEqual(path, [])
+
+    def test_board_search_is_selectable(self):
+        board = tasks.Board(tasks.KING, 'a1', search=tasks.DFS)
+
+        path = board.get_shortest_path((A, ONE), (C, THREE))
+
+        self.assertEqual(board.search, tasks.DFS)
+        self.assertEqual(path, [(A, ONE), (B, TWO), (C, THREE)])
+
+
+class TestDistanceMap(unittest.TestCase):
+
+    def test_distance_map_knight(self):
+        board = tasks.Board(tasks.KNIGHT, 'a1')
+
+        distances, parents = board.get_distance_map((A, ONE))
+
+        self.assertEqual(len(distances), 64)
+        self.assertEqual(distances[B, THREE], 1)
+        self.assertEqual(distances[H, EIGHT], 6)
+        self.assertEqual(len(tasks.trace_path(parents, (H, EIGHT))), 7)
+
+    def test_distance_map_bishop_stays_on_color(self):
+        board = tasks.Board(tasks.BISHOP, 'a1')
+
+        distances, _ = board.get_distance_map((A, ONE))
+
+        self.assertEqual(len(distances), 32)
+        self.assertNotIn((A, TWO), distances)
+
+    def test_farthest_target_counts_moves(self):
+        board = tasks.Board(tasks.ROOK, 'a1')
+        board.squares[B][TWO] = tasks.ENEMY
+        board.squares[H][ONE] = tasks.ENEMY
+
+        farthest = board.get_farthest_target()
+
+        self.assertEqual(farthest, (B, TWO))
+
+    def test_farthest_target_skips_unreachable(self):
+        board = tasks.Board(tasks.BISHOP, 'e4')
+        board.squares[A][SEVEN] = tasks.ENEMY
+        board.squares[D][THREE] = tasks.ENEMY
+
+        farthest = board.get_farthest_target()
+
+        self.assertEqual(farthest, (D, THREE))
+
+    def test_nearest_target_matches_depth_first(self):
+        targets = [(B, FOUR), (C, FOUR), (B, THREE), (C, THREE)]
+        board = tasks.Board(tasks.KING, 'h2')
+        for col, row in targets:
+            board.squares[col][row] = tasks.ENEMY
+
+        nearest = board.get_nearest_target((H, TWO), targets)
+        board.search = tasks.DFS
+        expected = board.get_nearest_target((H, TWO), targets)
+
+        self.assertEqual(nearest, expected)
+
+
+class TestDistanceMatrix(unittest.TestCase):
+
+    def test_distance_matrix_king(self):
+        board = tasks.Board(tasks.KING, 'a1', enemies=['c3', 'h8'])
+
+        matrix = board.get_distance_matrix()
+
+        self.assertEqual(matrix[A, ONE], {(C, THREE): 2, (H, EIGHT): 7})
+        self.assertEqual(matrix[C, THREE], {(H, EIGHT): 5})
+        self.assertEqual(matrix[H, EIGHT], {(C, THREE): 5})
+
+    def test_distance_matrix_with_captured_target(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'a8'])
+
+        matrix = board.get_distance_matrix()
+        after_capture = board.get_distance_matrix(captured=[(A, FOUR)])
+
+        self.assertEqual(matrix[A, ONE][A, EIGHT], 2)
+        self.assertEqual(after_capture[A, ONE], {(A, EIGHT): 1})
+        self.assertNotIn((A, FOUR), after_capture)
+        self.assertEqual(board.enemy_bits, tasks.to_mask(board.targets))
+
+    def test_distance_maps_are_cached_per_occupancy(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4'])
+
+        first = board.get_distance_map((A, ONE))
+        again = board.get_distance_map((A, ONE))
+        board.squares[A][FOUR] = tasks.EMPTY
+        emptied = board.get_distance_map((A, ONE))
+
+        self.assertIs(first, again)
+        self.assertIsNot(first, emptied)
+        self.assertEqual(emptied[0][A, EIGHT], 1)
+
+
+class TestShortestTour(unittest.TestCase):
+
+    targets = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+
+    def test_exact_tour_king(self):
+        board = tasks.Board(tasks.KING, 'h2', enemies=self.targets)
+
+        moves = board.get_fewest_moves_to_all_targets(exact=True)
+
+        self.assertEqual(sum(len(leg) for leg in moves), 19)
+        self.assertItemsEqual([leg[-1] for leg in moves], self.targets)
+
+    def test_exact_tour_knight_beats_greedy(self):
+        enemies = ['e4', 'g3', 'b8', 'd1', 'a4', 'c8']
+        greedy = tasks.Board(tasks.KNIGHT, 'f1', enemies=enemies)
+        exact = tasks.Board(tasks.KNIGHT, 'f1', enemies=enemies)
+
+        greedy_moves = greedy.get_fewest_moves_to_all_targets()
+        exact_moves = exact.get_fewest_moves_to_all_targets(exact=True)
+
+        self.assertEqual(sum(len(leg) for leg in greedy_moves), 14)
+        self.assertEqual(sum(len(leg) for leg in exact_moves), 11)
+
+    def test_exact_tour_uses_captured_squares(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'a8', 'h8'])
+
+        moves = board.get_fewest_moves_to_all_targets(exact=True)
+
+        self.assertEqual(moves, [['a4'], ['a8'], ['h8']])
+
+    def test_exact_tour_unreachable_target(self):
+        board = tasks.Board(tasks.BISHOP, 'a1', enemies=['c3', 'a2'])
+
+        self.assertRaises(tasks.NoPathToTargetError,
+                          board.get_fewest_moves_to_all_targets, True)
+
+    def test_shortest_tour_no_targets(self):
+        board = tasks.Board(tasks.QUEEN, 'a1', enemies=[])
+
+        self.assertEqual(board.get_shortest_tour((A, ONE), []), [])
+
+
+class TestSolve(unittest.TestCase):
+
+    def test_board_with_enemies(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'c1'])
+
+        self.assertEqual(board.targets, [(A, FOUR), (C, ONE)])
+        self.assertEqual(board.squares[A][FOUR], tasks.ENEMY)
+
+    def test_board_with_no_enemies(self):
+        board = tasks.Board(tasks.ROOK, 'a1', place_enemies=True,
+                            enemies=[])
+
+        self.assertEqual(board.targets, [])
+        self.assertEqual(board.enemy_bits, 0)
+
+    def test_solve_collect_with_no_enemies(self):
+        legs = tasks.solve(tasks.COLLECT, tasks.QUEEN, 'd4', [])
+
+        self.assertEqual(legs, [])
+
+    def test_solve_target_never_moves_given_enemies(self):
+        self.assertEqual(tasks.solve(tasks.TARGET, tasks.ROOK, 'a1', []), [])
+        self.assertEqual(
+            tasks.solve(tasks.TARGET, tasks.BISHOP, 'a1', ['a2']), [])
+
+    def test_solve_unknown_query(self):
+        self.assertRaises(ValueError, tasks.solve, 'colect', tasks.QUEEN,
+                          'd4')
+        response = tasks.answer({'query': 'colect', 'piece': tasks.QUEEN,
+                                 'position': 'd4'})
+
+        self.assertEqual(response, {'error': (
+            'ValueError: colect is not a query, choose from moves, '
+            'target, collect.')})
+
+    def test_solve_moves(self):
+        moves = tasks.solve(tasks.MOVES, tasks.KNIGHT, 'a1')
+
+        self.assertItemsEqual(moves, ['b3', 'c2'])
+
+    def test_solve_target(self):
+        path = tasks.solve(tasks.TARGET, tasks.ROOK, 'a1', ['a4', 'b2'])
+
+        self.assertEqual(path, ['a1', 'a2', 'b2'])
+
+    def test_answer(self):
+        response = tasks.answer({'id': 7, 'piece': tasks.KNIGHT,
+                                 'position': 'a1'})
+
+        self.assertEqual(response['id'], 7)
+        self.assertItemsEqual(response['result'], ['b3', 'c2'])
+
+    def test_answer_missing_argument(self):
+        response = tasks.answer({'query': tasks.MOVES, 'position': 'a1'})
+
+        self.assertEqual(response, {'error': "KeyError: 'piece'"})
+
+    def test_solve_collect_places_random_enemies(self):
+        legs = tasks.solve(tasks.COLLECT, tasks.QUEEN, 'd4')
+
+        self.assertEqual(len(legs), 8)
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_least_recently_used_is_evicted(self):
+        cache = tasks.LRUCache(2)
+        cache['a'] = 1
+        cache['b'] = 2
+        cache.get('a')
+        cache['c'] = 3
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.get('b', 'missing'), 'missing')
+
+    def test_stats(self):
+        cache = tasks.LRUCache(1)
+        cache['a'] = 1
+        cache.get('a')
+        cache.get('b')
+        cache['b'] = 2
+
+        expected = {'hits': 1, 'misses': 1, 'evictions': 1,
+                    'size': 1, 'maxsize': 1}
+        self.assertEqual(cache.stats(), expected)
+
+    def test_replacing_a_value(self):
+        cache = tasks.LRUCache(2)
+        cache['a'] = 1
+        cache['a'] = 2
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('a'), 2)
+
+
+class TestMoveCache(unittest.TestCase):
+
+    def setUp(self):
+        self.board = tasks.Board(tasks.ROOK, 'a1')
+        self.board.move_cache = tasks.LRUCache(16)
+
+    def test_repeated_moves_hit_the_cache(self):
+        first = self.board._get_available_moves(tasks.ROOK, A, ONE)
+        again = self.board._get_available_moves(tasks.ROOK, A, ONE)
+
+        self.assertIs(first, again)
+        self.assertEqual(self.board.move_cache.hits, 1)
+
+    def test_enemies_off_the_rays_share_moves(self):
+        self.board._get_available_moves(tasks.ROOK, A, ONE)
+        self.board.squares[D][FOUR] = tasks.ENEMY
+        self.board._get_available_moves(tasks.ROOK, A, ONE)
+
+        self.assertEqual(self.board.move_cache.hits, 1)
+
+    def test_enemy_on_a_ray_changes_moves(self):
+        self.board._get_available_moves(tasks.ROOK, A, ONE)
+        self.board.squares[A][FOUR] = tasks.ENEMY
+
+        moves = self.board.get_available_moves()
+
+        self.assertEqual(self.board.move_cache.hits, 0)
+        self.assertEqual(len(moves), 10)
+
+
+class TestSearchStats(unittest.TestCase):
+
+    targets = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+
+    def setUp(self):
+        # paths found by other tests would skip the searches counted here
+        tasks.TRANSPOSITIONS.clear()
+
+    def test_no_stats_by_default(self):
+        board = tasks.Board(tasks.QUEEN, 'h2', enemies=self.targets)
+
+        board.get_fewest_moves_to_all_targets()
+
+        self.assertIsNone(board.stats)
+
+    def test_collect_stats(self):
+        stats = tasks.SearchStats()
+        board = tasks.Board(tasks.QUEEN, 'h2', enemies=self.targets,
+                            stats=stats)
+        board.move_cache = tasks.LRUCache(1024)
+
+        board.get_fewest_moves_to_all_targets()
+        result = stats.as_dict()
+
+        self.assertEqual(result['searches'], 8)
+        self.assertEqual(result['move_generations'],
+                         result['nodes_expanded'])
+        self.assertEqual(result['move_generations'],
+                         result['move_cache_hits'] +
+                         result['move_cache_misses'])
+        self.assertTrue(result['max_frontier'] > 1)
+        for phase in ['search', 'legs', 'tour']:
+            self.assertIn(phase + '_time', result)
+        # the board was set up before the query
+        self.assertNotIn('setup_time', result)
+        self.assertTrue(result['tour_time'] >= result['legs_time'] >=
+                        result['search_time'])
+
+    def test_depth_first_stats(self):
+        stats = tasks.SearchStats()
+        board = tasks.Board(tasks.KNIGHT, 'a1', enemies=['c2'],
+                            search=tasks.DFS, stats=stats)
+
+        board.get_shortest_path((A, ONE), (C, TWO))
+
+        self.assertEqual(stats.counters['searches'], 1)
+        self.assertEqual(stats.counters['max_depth'], 1)
+
+    def test_hook_is_called_per_query(self):
+        calls = []
+        stats = tasks.SearchStats(lambda query, s: calls.append(query))
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['b2'], stats=stats)
+
+        board.get_available_moves()
+        board.get_fewest_moves_to_farthest_target()
+
+        self.assertEqual(calls, [tasks.MOVES, tasks.TARGET])
+        self.assertEqual(stats.counters['distance_cache_misses'], 1)
+        self.assertIn('targets_time', stats.as_dict())
+
+    def test_each_query_has_its_own_stats(self):
+        emitted = []
+        stats = tasks.SearchStats(
+            lambda query, s: emitted.append((query, s)))
+        board = tasks.Board(tasks.QUEEN, 'h2', enemies=self.targets,
+                            stats=stats)
+
+        board.get_fewest_moves_to_farthest_target()
+        board.get_fewest_moves_to_all_targets()
+        list(board.iter_legs())
+
+        self.assertEqual([query for query, _ in emitted],
+                         [tasks.TARGET, tasks.COLLECT, tasks.COLLECT])
+        target, collect, legs = [s for _, s in emitted]
+        self.assertEqual(target['searches'], 1)
+        self.assertNotIn('tour_time', target)
+        self.assertNotIn('query_time', collect)
+        self.assertEqual(collect['distance_cache_misses'], 7)
+        self.assertIn('legs_time', legs)
+        self.assertNotIn('tour_time', legs)
+
+
+class TestDistanceTables(unittest.TestCase):
+
+    def test_tables_match_empty_board_search(self):
+        for piece in tasks.PIECES:
+            board = tasks.Board(piece, 'a2')
+            board.squares = [[tasks.EMPTY] * 8 for _ in range(8)]
+            for origin in tasks.SQUARES[8:]:
+                distances, parents = board._search_distances(
+                    origin, None, 0)
+                for target in tasks.SQUARES:
+                    expected = distances.get(target)
+                    self.assertEqual(tasks.DISTANCE_TABLES.distance(
+                        piece, origin, target), expected)
+                    if expected and piece in tasks.TABLE_PIECES:
+                        self.assertEqual(
+                            tasks.DISTANCE_TABLES.path(piece, origin, target),
+                            tasks.trace_path(parents, target))
+
+    def test_table_paths_match_search_on_open_boards(self):
+        rng = random.Random(0)
+        for piece in sorted(tasks.TABLE_PIECES):
+            for _ in range(20):
+                squares = rng.sample(tasks.SQUARES, 6)
+                board = tasks.Board(
+                    piece, tasks.to_algebraic(*squares[0]),
+                    enemies=[tasks.to_algebraic(*sq) for sq in squares[2:]])
+                origin, target = squares[:2]
+                distances, parents = board._search_distances(
+                    origin, None, board.enemy_bits)
+
+                path = board.get_table_path(origin, target)
+
+                if target not in distances:
+                    self.assertEqual(path, [])
+                elif path is not None:
+                    self.assertEqual(path, tasks.trace_path(parents, target))
+
+    def test_blocked_table_path(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4'])
+
+        self.assertIsNone(board.get_table_path((A, ONE), (A, EIGHT)))
+        self.assertEqual(board.get_shortest_path((A, ONE), (A, EIGHT)),
+                         [(A, ONE), (A, FOUR), (A, EIGHT)])
+
+    def test_load_builds_and_maps_tables(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'distances.bin')
+
+        built = tasks.load_distance_tables(path)
+        mapped = tasks.load_distance_tables(path)
+
+        self.assertIsInstance(mapped.data, mmap.mmap)
+        self.assertEqual(built.data[:], tasks.DISTANCE_TABLES.data[:])
+        self.assertEqual(mapped.distance(tasks.KNIGHT, (A, ONE), (H, EIGHT)),
+                         6)
+
+
+class TestAStarSearch(unittest.TestCase):
+
+    def setUp(self):
+        tasks.TRANSPOSITIONS.clear()
+
+    def test_lower_bounds_never_overestimate(self):
+        for piece in tasks.PIECES:
+            bound = tasks.LOWER_BOUNDS[piece]
+            for origin in tasks.SQUARES[8:]:
+                for target in tasks.SQUARES:
+                    moves = tasks.DISTANCE_TABLES.distance(
+                        piece, origin, target)
+                    estimate = bound(origin, target)
+                    if estimate is None:
+                        self.assertIsNone(moves)
+                    elif moves is not None:
+                        self.assertLessEqual(estimate, moves)
+
+    def test_knight_distance_is_exact_away_from_corners(self):
+        for origin in [(C, THREE), (D, FOUR), (F, FIVE)]:
+            for target in [(D, FIVE), (H, EIGHT), (B, TWO), (E, FOUR)]:
+                self.assertEqual(
+                    tasks.knight_distance(origin, target),
+                    tasks.DISTANCE_TABLES.distance(
+                        tasks.KNIGHT, origin, target))
+
+    def test_tables_bound_standard_boards(self):
+        board = tasks.Board(tasks.KNIGHT, 'a1')
+        bound = board.get_lower_bound()
+        self.assertEqual(bound((A, ONE), (B, TWO)), 4)
+        self.assertEqual(bound((A, ONE), (A, ONE)), 0)
+        wide = tasks.Board(tasks.KNIGHT, 'a1', width=9)
+        self.assertIs(wide.get_lower_bound(), tasks.knight_distance)
+        pawn = tasks.Board(tasks.PAWN, 'a2')
+        self.assertIs(pawn.get_lower_bound(), tasks.pawn_distance)
+
+    def test_table_bound_expands_fewer_squares(self):
+        stats = tasks.SearchStats()
+        board = tasks.Board(tasks.KNIGHT, 'a1', enemies=['a8'],
+                            stats=stats)
+        board.get_a_star_path((A, ONE), (A, EIGHT))
+        expanded = stats.as_dict()['nodes_expanded']
+        stats.reset()
+        board.standard = False
+        board.get_a_star_path((A, ONE), (A, EIGHT))
+
+        self.assertLess(expanded, stats.as_dict()['nodes_expanded'])
+
+    def test_a_star_paths_are_shortest(self):
+        rng = random.Random(0)
+        for piece in tasks.PIECES:
+            for _ in range(20):
+                squares = rng.sample(tasks.SQUARES[8:], 10)
+                board = tasks.Board(
+                    piece, tasks.to_algebraic(*squares[0]),
+                    enemies=[tasks.to_algebraic(*sq) for sq in squares[1:]])
+                distances, _ = board.get_distance_map(squares[0])
+                for target in squares[1:]:
+                    path = board.get_shortest_path(
+                        squares[0], target, search=tasks.ASTAR)
+                    self.assertEqual(len(path) - 1,
+                                     distances.get(target, -1))
+                    for start, end in zip(path, path[1:]):
+                        self.assertIn(end, board._get_available_moves(
+                            piece, *start))
+
+    def test_a_star_expands_fewer_squares(self):
+        board = tasks.Board(tasks.KING, 'a1', search=tasks.ASTAR,
+                            stats=tasks.SearchStats())
+
+        path = board.get_shortest_path((A, ONE), (H, EIGHT))
+
+        self.assertEqual(len(path), 8)
+        self.assertEqual(board.stats.counters['nodes_expanded'], 7)
+
+
+class TestIncrementalUpdates(unittest.TestCase):
+
+    def test_make_and_unmake_capture(self):
+        board = tasks.Board(tasks.QUEEN, 'a1', enemies=['a4', 'd4'])
+        squares = [list(column) for column in board.squares]
+        bits = board.enemy_bits, board.occupied_bits
+
+        undo = board.make_capture((A, FOUR))
+        captured = board.enemy_bits, board.col, board.row
+        board.unmake_capture(undo)
+
+        self.assertEqual(captured, (1 << tasks.square_index(D, FOUR),
+                                    A, FOUR))
+        self.assertEqual([list(column) for column in board.squares],
+                         squares)
+        self.assertEqual((board.enemy_bits, board.occupied_bits), bits)
+        self.assertEqual((board.col, board.row), (A, ONE))
+
+    def test_repaired_distances_match_search(self):
+        rng = random.Random(0)
+        for piece in [tasks.ROOK, tasks.BISHOP, tasks.QUEEN]:
+            for _ in range(30):
+                squares = rng.sample(tasks.SQUARES, 12)
+                board = tasks.Board(
+                    piece, tasks.to_algebraic(*squares[0]),
+                    enemies=[tasks.to_algebraic(*sq) for sq in squares[1:]])
+                before, _ = board.get_distance_map(squares[0])
+                board.squares[squares[1][0]][squares[1][1]] = tasks.EMPTY
+
+                repaired = board.repair_distances(
+                    before, squares[1], board.enemy_bits)
+                expected, _ = board.get_distance_map(squares[0])
+
+                self.assertEqual(repaired, expected)
+
+    def test_exact_tour_repairs_distances(self):
+        targets = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+        board = tasks.Board(tasks.QUEEN, 'h2', enemies=targets,
+                            stats=tasks.SearchStats())
+
+        moves = board.get_fewest_moves_to_all_targets(exact=True)
+
+        counters = board.stats.counters
+        self.assertEqual(sum(len(leg) for leg in moves), 8)
+        self.assertTrue(counters['distance_repairs'] >
+                        counters['searches'])
+
+
+class TestCompactBoard(unittest.TestCase):
+
+    def setUp(self):
+        self.board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'd1', 'f6'])
+
+    def test_board_has_slots(self):
+        with self.assertRaises(AttributeError):
+            self.board.color = 'white'
+        with self.assertRaises(AttributeError):
+            self.board.squares[A].color = 'white'
+
+    def test_squares_are_built_from_bitboards(self):
+        self.assertIsNone(self.board._squares)
+        self.assertEqual(self.board.squares[A][FOUR], tasks.ENEMY)
+        self.assertEqual(self.board.squares[A][ONE], tasks.FRIENDLY)
+        self.assertEqual(self.board.squares[B][ONE], tasks.EMPTY)
+        self.assertEqual(self.board.targets,
+                         [(A, FOUR), (D, ONE), (F, SIX)])
+
+    def test_clone_is_independent(self):
+        clone = self.board.clone()
+        clone.make_capture((A, FOUR))
+        clone.squares[H][EIGHT] = tasks.ENEMY
+
+        self.assertEqual((self.board.col, self.board.row), (A, ONE))
+        self.assertEqual(self.board.squares[A][FOUR], tasks.ENEMY)
+        self.assertEqual(self.board.squares[H][EIGHT], tasks.EMPTY)
+        self.assertEqual(clone.get_square(A, ONE), tasks.EMPTY)
+        self.assertIs(clone.distance_maps, self.board.distance_maps)
+
+    def test_clone_solves_like_the_original(self):
+        clone = self.board.clone()
+        self.assertEqual(clone.get_fewest_moves_to_all_targets(),
+                         self.board.get_fewest_moves_to_all_targets())
+
+    def test_pickle_round_trip(self):
+        self.board.get_distance_map((A, ONE))
+        data = pickle.dumps(self.board, pickle.HIGHEST_PROTOCOL)
+        board = pickle.loads(data)
+
+        self.assertLess(len(data), 200)
+        self.assertEqual((board.enemy_bits, board.occupied_bits),
+                         (self.board.enemy_bits, self.board.occupied_bits))
+        self.assertEqual(board.targets, self.board.targets)
+        self.assertEqual(len(board.distance_maps), 0)
+        self.assertEqual(board.get_farthest_target(),
+                         self.board.get_farthest_target())
+
+
+class TestBoardSizes(unittest.TestCase):
+
+    def get_random_board(self, piece, width, height, seed):
+        rng = random.Random(seed)
+        squares = rng.sample(tasks.get_grid(width, height),
+                             width * height // 6 + 1)
+        return tasks.Board(
+            piece, tasks.to_algebraic(*squares[0]), width=width,
+            height=height,
+            enemies=[tasks.to_algebraic(*sq) for sq in squares[1:]])
+
+    def test_wide_column_names(self):
+        self.assertEqual(tasks.to_algebraic(25, 0), 'z1')
+        self.assertEqual(tasks.to_algebraic(26, 99), 'aa100')
+        self.assertEqual(tasks.to_algebraic(511, 511), 'sr512')
+        for col in range(tasks.MAX_BOARD_SIZE):
+            position = tasks.to_algebraic(col, 41)
+            self.assertEqual(tasks.from_algebraic(position), (col, 41))
+
+    def test_bad_squares(self):
+        for position in ['1a', 'a', 'A1', 'a1b']:
+            with self.assertRaises(ValueError):
+                tasks.from_algebraic(position)
+        with self.assertRaises(tasks.IllegalPositionError):
+            tasks.Board(tasks.ROOK, 'i1')
+        with self.assertRaises(ValueError):
+            tasks.Board(tasks.ROOK, 'a1', width=tasks.MAX_BOARD_SIZE + 1)
+
+    def test_grid_moves_match_tables(self):
+        for piece in tasks.PIECES:
+            board = self.get_random_board(piece, 8, 8, 0)
+            for col, row in tasks.SQUARES[8:]:
+                self.assertEqual(
+                    board.get_grid_moves(piece, col, row, board.enemy_bits),
+                    list(board._get_available_moves(piece, col, row)))
+
+    def test_grid_moves_match_walking(self):
+        for piece in tasks.PIECES:
+            board = self.get_random_board(piece, 11, 6, 1)
+            for col, row in board.grid[11:]:
+                self.assertEqual(
+                    board._get_available_moves(piece, col, row),
+                    board._walk_available_moves(piece, col, row))
+
+    def test_short_board_pawn(self):
+        board = tasks.Board(tasks.PAWN, 'b2', width=3, height=3)
+
+        self.assertEqual(board.get_available_moves(), ['b3'])
+
+    def test_sliding_search_finds_shortest_distances(self):
+        for piece in [tasks.ROOK, tasks.BISHOP, tasks.QUEEN]:
+            board = self.get_random_board(piece, 8, 8, 2)
+            origin = board.col, board.row
+            self.assertEqual(
+                board._search_sliding_distances(origin, None,
+                                                board.enemy_bits)[0],
+                board._search_distances(origin, None, board.enemy_bits)[0])
+
+    def test_large_board(self):
+        board = tasks.Board(tasks.QUEEN, 'a1', width=200, height=150,
+                            enemies=['b2', 'a3', 'gr150'])
+
+        distances, _ = board.get_distance_map((A, ONE))
+
+        self.assertEqual(len(distances), 200 * 150)
+        self.assertEqual(max(distances.values()), 2)
+        self.assertEqual(board.get_shortest_path((A, ONE), (199, 149)),
+                         [(A, ONE), (50, ONE), (199, 149)])
+        self.assertEqual(board.distance_maps.maxsize, tasks.MIN_CACHE_SIZE)
+
+    def test_collect_on_a_bigger_board(self):
+        enemies = ['a20', 'k3', 't12', 'f17', 'p1', 'c9']
+        for piece in [tasks.ROOK, tasks.KNIGHT, tasks.QUEEN]:
+            greedy = tasks.Board(piece, 'j10', enemies=enemies, width=20,
+                                 height=20)
+            exact = greedy.clone()
+
+            approximate = greedy.get_fewest_moves_to_all_targets()
+            shortest = exact.get_fewest_moves_to_all_targets(exact=True)
+
+            self.assertItemsEqual([leg[-1] for leg in shortest], enemies)
+            self.assertLessEqual(sum(map(len, shortest)),
+                                 sum(map(len, approximate)))
+
+    def test_answer_with_board_size(self):
+        response = tasks.answer({'piece': tasks.KNIGHT, 'position': 'z26',
+                                 'width': 26, 'height': 26})
+
+        self.assertItemsEqual(response['result'], ['x25', 'y24'])
+
+    def test_pickle_keeps_size(self):
+        board = self.get_random_board(tasks.KING, 30, 9, 3)
+
+        copy = pickle.loads(pickle.dumps(board))
+
+        self.assertEqual((copy.width, copy.height), (30, 9))
+        self.assertEqual(copy.get_farthest_target(),
+                         board.get_farthest_target())
+
+
+class TestImprovedTour(unittest.TestCase):
+
+    def get_line_costs(self, places):
+        # moves between points on a line, starting from the first
+        return [[abs(a - b) for b in places] for a in places]
+
+    def test_enemy_count(self):
+        board = tasks.Board(tasks.QUEEN, 'd4', place_enemies=True,
+                            enemy_count=20)
+
+        self.assertEqual(len(board.targets), 20)
+        self.assertRaises(ValueError, tasks.Board, tasks.QUEEN, 'd4',
+                          place_enemies=True, enemy_count=64)
+
+    def test_construction(self):
+        cost = self.get_line_costs([0, 2, -1, 5])
+
+        self.assertEqual(tasks.nearest_neighbour_tour(cost), [0, 2, 1, 3])
+        self.assertEqual(tasks.farthest_insertion_tour(cost), [0, 2, 1, 3])
+        self.assertEqual(tasks.tour_length(cost, [0, 2, 1, 3]), 7)
+        self.assertEqual(tasks.tour_lower_bound(cost), 6)
+
+    def test_two_opt_untangles(self):
+        cost = self.get_line_costs(range(6))
+        tour = [0, 4, 3, 2, 1, 5]
+
+        tasks.improve_tour(cost, tour)
+
+        self.assertEqual(tour, list(range(6)))
+
+    def test_improvements_never_lengthen_tours(self):
+        rng = random.Random(0)
+        for _ in range(20):
+            points = [(rng.randrange(20), rng.randrange(20))
+                      for _ in range(rng.randrange(2, 30))]
+            cost = [[tasks.king_distance(a, b) for b in points]
+                    for a in points]
+            tour = tasks.nearest_neighbour_tour(cost)
+            before = tasks.tour_length(cost, tour)
+
+            tasks.improve_tour(cost, tour)
+
+            self.assertEqual(tour[0], 0)
+            self.assertEqual(sorted(tour), list(range(len(points))))
+            self.assertLessEqual(tasks.tour_length(cost, tour), before)
+            self.assertGreaterEqual(tasks.tour_length(cost, tour),
+                                    tasks.tour_lower_bound(cost))
+
+    def test_one_way_costs_keep_direction(self):
+        # going up a row costs one move, coming back down costs ten
+        places = [0, 3, 1, 2]
+        cost = [[b - a if b >= a else 10 * (a - b) for b in places]
+                for a in places]
+        tour = [0, 1, 2, 3]
+
+        tasks.improve_tour(cost, tour, symmetric=False)
+
+        self.assertEqual(tour, [0, 2, 3, 1])
+
+    def test_collect_many_targets(self):
+        stats = tasks.SearchStats()
+        board = tasks.Board(tasks.ROOK, 'h9', place_enemies=True,
+                            enemy_count=40, width=16, height=16, stats=stats)
+        targets = [tasks.to_algebraic(*t) for t in board.targets]
+
+        legs = board.get_fewest_moves_to_all_targets(improve=True)
+
+        counters = stats.counters
+        self.assertItemsEqual([leg[-1] for leg in legs], targets)
+        self.assertLessEqual(sum(map(len, legs)), counters['improved_moves'])
+        self.assertLessEqual(sum(map(len, legs)), counters['greedy_moves'])
+        self.assertLessEqual(counters['improved_moves'],
+                             counters['constructed_moves'])
+        self.assertLessEqual(counters['tour_lower_bound'],
+                             counters['improved_moves'])
+        self.assertIn('improve_time', stats.as_dict())
+
+    def test_improved_never_longer_than_greedy_for_sliders(self):
+        for piece in [tasks.ROOK, tasks.QUEEN]:
+            for seed in range(3):
+                random.seed(seed)
+                board = tasks.Board(piece, 'a1', place_enemies=True,
+                                    enemy_count=40, width=16, height=16)
+
+                greedy = board.get_fewest_moves_to_all_targets(improve=False)
+                improved = board.get_fewest_moves_to_all_targets(
+                    improve=True)
+
+                self.assertLessEqual(sum(map(len, improved)),
+                                     sum(map(len, greedy)))
+
+    def test_improved_by_default_for_jumping_pieces(self):
+        for piece, improved in [(tasks.KNIGHT, True), (tasks.KING, True),
+                                (tasks.ROOK, False), (tasks.QUEEN, False)]:
+            stats = tasks.SearchStats()
+            board = tasks.Board(piece, 'a1', place_enemies=True,
+                                enemy_count=20, stats=stats)
+
+            board.get_fewest_moves_to_all_targets()
+
+            self.assertEqual(stats.counters['improved_moves'] > 0, improved)
+
+    def test_improve_on_few_targets(self):
+        board = tasks.Board(tasks.KNIGHT, 'h2', enemies=[
+            'g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8'])
+
+        legs = board.get_fewest_moves_to_all_targets(improve=True)
+
+        self.assertEqual(len(legs), 8)
+        self.assertLessEqual(sum(map(len, legs)), 19)
+
+    def test_solve_with_enemy_count(self):
+        legs = tasks.solve(tasks.COLLECT, tasks.QUEEN, 'd4', enemy_count=30)
+
+        self.assertEqual(len(legs), 30)
+
+
+class TestDeadlines(unittest.TestCase):
+
+    targets = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+
+    def get_expired_deadline(self):
+        deadline = tasks.Deadline()
+        deadline.cancel()
+        return deadline
+
+    def test_deadline(self):
+        self.assertFalse(tasks.Deadline().expired())
+        self.assertFalse(tasks.Deadline(60).expired())
+        self.assertTrue(tasks.Deadline(0).expired())
+        self.assertTrue(self.get_expired_deadline().expired())
+
+    def test_farthest_target_in_time(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'b2'])
+
+        solution = board.get_fewest_moves_to_farthest_target(
+            tasks.Deadline(60))
+
+        self.assertEqual(solution, (['a1', 'a2', 'b2'], True))
+        self.assertIsNone(board.deadline)
+
+    def test_farthest_target_out_of_time(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'b2'])
+
+        solution = board.get_fewest_moves_to_farthest_target(
+            self.get_expired_deadline())
+
+        self.assertEqual(solution, ([], False))
+
+    def test_depth_first_farthest_target_out_of_time(self):
+        # the breadth first search for the farthest target is quick, but
+        # checking every path to it isn't
+        board = tasks.Board(tasks.KING, 'a1', enemies=['l12', 'b2'],
+                            search=tasks.DFS, width=12, height=12)
+
+        path, optimal = board.get_fewest_moves_to_farthest_target(
+            tasks.Deadline(0.3))
+
+        self.assertTrue(optimal)
+        self.assertEqual(len(path), 12)
+
+    def test_exact_tour_in_time(self):
+        board = tasks.Board(tasks.KNIGHT, 'h2', enemies=self.targets)
+
+        legs, optimal = board.get_fewest_moves_to_all_targets(
+            exact=True, deadline=tasks.Deadline(60))
+
+        self.assertTrue(optimal)
+        self.assertEqual(sum(map(len, legs)), 16)
+
+    def test_tours_out_of_time(self):
+        for search in [tasks.BFS, tasks.DFS, tasks.ASTAR]:
+            for exact in [False, True]:
+                board = tasks.Board(tasks.KNIGHT, 'h2', enemies=self.targets,
+                                    search=search)
+
+                legs, optimal = board.get_fewest_moves_to_all_targets(
+                    exact=exact, deadline=self.get_expired_deadline())
+
+                # the tour stops short with the legs it found in time
+                self.assertFalse(optimal)
+                ends = [leg[-1] for leg in legs]
+                self.assertEqual(len(set(ends)), len(ends))
+                self.assertLessEqual(set(ends), set(self.targets))
+
+    def test_legs_stop_at_deadline(self):
+        # every leg takes a long search on a board this big
+        board = tasks.Board(tasks.QUEEN, 'a1', place_enemies=True,
+                            width=512, height=512)
+
+        solution = board.get_fewest_moves_to_all_targets(
+            deadline=self.get_expired_deadline())
+
+        self.assertEqual(solution, ([], False))
+
+    def test_exact_tour_with_many_targets(self):
+        board = tasks.Board(tasks.KING, 'a1', place_enemies=True,
+                            enemy_count=63)
+
+        legs, optimal = board.get_fewest_moves_to_all_targets(
+            exact=True, deadline=tasks.Deadline(0.1))
+
+        self.assertFalse(optimal)
+        self.assertLessEqual(len(legs), 63)
+
+    def test_cancel_from_another_thread(self):
+        # far too many targets to finish an exact tour
+        board = tasks.Board(tasks.KING, 'a1', place_enemies=True,
+                            enemy_count=20, width=20, height=20)
+        deadline = tasks.Deadline()
+        timer = threading.Timer(0.2, deadline.cancel)
+        timer.start()
+
+        legs, optimal = board.get_fewest_moves_to_all_targets(
+            exact=True, deadline=deadline)
+
+        timer.join()
+        self.assertFalse(optimal)
+        self.assertLess(len(legs), 20)
+
+    def test_improvements_stop_at_deadline(self):
+        cost = [[abs(a - b) for b in range(6)] for a in range(6)]
+        tour = [0, 4, 3, 2, 1, 5]
+
+        improvements = tasks.improve_tour(
+            cost, tour, deadline=self.get_expired_deadline())
+
+        self.assertEqual(improvements, 0)
+        self.assertEqual(tour, [0, 4, 3, 2, 1, 5])
+
+    def test_answer_with_time_limit(self):
+        response = tasks.answer({'query': tasks.TARGET,
+                                 'piece': tasks.ROOK, 'position': 'a1',
+                                 'enemies': ['a4', 'b2'], 'time_limit': 60})
+
+        self.assertEqual(response, {'result': ['a1', 'a2', 'b2'],
+                                    'optimal': True})
+
+
+class TestSymmetryCache(unittest.TestCase):
+    ENEMIES = [(B, TWO), (C, SEVEN), (F, THREE), (H, EIGHT)]
+
+    def get_images(self, piece, origin, enemies, width=8, height=8):
+        # a board for every turned or mirrored copy of the position
+        for symmetry in tasks.get_symmetries(piece, width, height):
+            turned = [tasks.to_algebraic(*tasks.transform(
+                square, symmetry, width, height)) for square in enemies]
+            yield tasks.Board(piece, tasks.to_algebraic(*tasks.transform(
+                origin, symmetry, width, height)), enemies=turned,
+                width=width, height=height)
+
+    def check_path(self, board, path):
+        self.assertEqual(path[0], board.position)
+        for start, end in zip(path, path[1:]):
+            self.assertIn(tasks.from_algebraic(end),
+                          board._get_available_moves(
+                              board.piece, *tasks.from_algebraic(start)))
+
+    def test_transform_round_trip(self):
+        for symmetry in tasks.SYMMETRIES:
+            for square in [(A, ONE), (C, SEVEN), (H, TWO)]:
+                turned = tasks.transform(square, symmetry, 8, 8)
+                self.assertEqual(
+                    tasks.untransform(turned, symmetry, 8, 8), square)
+
+    def test_unreachable_target_is_kept_for_its_layout(self):
+        cache = tasks.SymmetryCache()
+        board = tasks.Board(tasks.BISHOP, 'a1', enemies=['a2'])
+
+        self.assertEqual(cache.solve(board, tasks.TARGET), [])
+        self.assertEqual(cache.solve(board, tasks.TARGET), [])
+        self.assertEqual(board.targets, [(A, TWO)])
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_random_enemies_are_set_up_again(self):
+        random.seed(3)
+        board = tasks.Board(tasks.BISHOP, 'a1', place_enemies=True,
+                            enemy_count=1)
+        while sum(board.targets[0]) % 2 == 0:
+            board = tasks.Board(tasks.BISHOP, 'a1', place_enemies=True,
+                                enemy_count=1)
+        cache = tasks.SymmetryCache()
+
+        path = cache.solve(board, tasks.TARGET)
+
+        # the answer is for another layout, and only the board's own
+        # answer is kept
+        self.assertEqual(path[0], 'a1')
+        self.assertEqual(sum(tasks.from_algebraic(path[-1])) % 2, 0)
+        given = tasks.Board(tasks.BISHOP, 'a1', enemies=[
+            tasks.to_algebraic(*board.targets[0])])
+        self.assertEqual(cache.solve(given, tasks.TARGET), [])
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_symmetries(self):
+        self.assertEqual(len(tasks.get_symmetries(tasks.QUEEN, 8, 8)), 8)
+        self.assertEqual(len(tasks.get_symmetries(tasks.QUEEN, 8, 5)), 4)
+        self.assertEqual(tasks.get_symmetries(tasks.PAWN, 8, 8),
+                         [(False, False, False), (False, True, False)])
+
+    def test_images_share_one_answer(self):
+        cache = tasks.SymmetryCache()
+        for board in self.get_images(tasks.QUEEN, (A, ONE), self.ENEMIES):
+            path = cache.solve(board, tasks.TARGET)
+
+            expected = board.get_fewest_moves_to_farthest_target()
+
+            self.check_path(board, path)
+            self.assertIn(tasks.from_algebraic(path[-1]), board.targets)
+            self.assertEqual(len(path), len(expected))
+        self.assertEqual(cache.stats()['size'], 1)
+        self.assertEqual(cache.stats()['hits'], 7)
+
+    def test_moves(self):
+        cache = tasks.SymmetryCache()
+        for board in self.get_images(tasks.BISHOP, (C, ONE), self.ENEMIES):
+            self.assertItemsEqual(cache.solve(board, tasks.MOVES),
+                                  board.get_available_moves())
+        self.assertEqual(len(cache.results), 1)
+
+    def test_collect(self):
+        cache = tasks.SymmetryCache()
+        for board in self.get_images(tasks.KNIGHT, (D, FOUR), self.ENEMIES):
+            legs = cache.solve(board, tasks.COLLECT, exact=True)
+
+            expected = board.get_fewest_moves_to_all_targets(exact=True)
+
+            self.check_path(board, [board.position] + sum(legs, []))
+            self.assertItemsEqual([leg[-1] for leg in legs],
+                                  [tasks.to_algebraic(*target)
+                                   for target in board.targets])
+            self.assertEqual(len(sum(legs, [])), len(sum(expected, [])))
+        self.assertEqual(len(cache.results), 1)
+
+    def test_pawns_are_only_mirrored(self):
+        cache = tasks.SymmetryCache()
+        layouts = [('c2', ['b4', 'g5']), ('f2', ['g4', 'b5']),
+                   ('c7', ['b5', 'g4'])]
+        for position, enemies in layouts:
+            board = tasks.Board(tasks.PAWN, position, enemies=enemies)
+            self.assertItemsEqual(cache.solve(board, tasks.MOVES),
+                                  board.get_available_moves())
+        self.assertEqual(len(cache.results), 2)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_rectangular_boards(self):
+        cache = tasks.SymmetryCache()
+        for board in self.get_images(tasks.ROOK, (A, ONE),
+                                     [(B, TWO), (8, 3)], 9, 5):
+            self.check_path(board, cache.solve(board, tasks.TARGET))
+        self.assertEqual(len(cache.results), 1)
+
+    def test_solve_with_cache(self):
+        cache = tasks.SymmetryCache()
+
+        first = tasks.solve(tasks.TARGET, tasks.ROOK, 'a1', ['a4', 'b2'],
+                            cache=cache)
+        second = tasks.solve(tasks.TARGET, tasks.ROOK, 'h8', ['h5', 'g7'],
+                             cache=cache)
+        timed = tasks.solve(tasks.TARGET, tasks.ROOK, 'a8', ['a5', 'b7'],
+                            time_limit=60, cache=cache)
+
+        self.assertEqual(len(first), 3)
+        self.assertEqual(second, [tasks.to_algebraic(*tasks.transform(
+            tasks.from_algebraic(square), (False, True, True), 8, 8))
+            for square in first])
+        self.assertTrue(timed.optimal)
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_answer_with_cache(self):
+        cache = tasks.SymmetryCache()
+        request = {'piece': tasks.KNIGHT, 'position': 'h8'}
+
+        tasks.answer({'piece': tasks.KNIGHT, 'position': 'a1'}, cache)
+        response = tasks.answer(request, cache)
+
+        self.assertItemsEqual(response['result'], ['g6', 'f7'])
+        self.assertEqual(cache.stats()['hits'], 1)
+
+
+class TestZobrist(unittest.TestCase):
+
+    def setUp(self):
+        tasks.TRANSPOSITIONS.clear()
+
+    def check_hash(self, board):
+        self.assertEqual(board.zobrist, tasks.zobrist_hash(
+            board.enemy_bits, board.occupied_bits))
+
+    def test_hash_follows_the_position(self):
+        board = tasks.Board(tasks.QUEEN, 'a1', enemies=['a4', 'd4'])
+        start = board.zobrist
+        self.check_hash(board)
+
+        undo = board.make_capture((A, FOUR))
+        self.check_hash(board)
+        self.assertNotEqual(board.zobrist, start)
+        board.unmake_capture(undo)
+        self.assertEqual(board.zobrist, start)
+
+        board.squares[C][THREE] = tasks.ENEMY
+        self.check_hash(board)
+        board.squares[C][THREE] = tasks.EMPTY
+        self.assertEqual(board.zobrist, start)
+
+    def test_same_position_same_hash(self):
+        board = tasks.Board(tasks.ROOK, 'a1', enemies=['a4', 'c1'])
+        board.make_capture((A, FOUR))
+        other = tasks.Board(tasks.ROOK, 'a4', enemies=['c1'])
+
+        self.assertEqual(board.zobrist, other.zobrist)
+        self.assertEqual(board.clone().zobrist, board.zobrist)
+        self.assertEqual(pickle.loads(pickle.dumps(board)).zobrist,
+                         board.zobrist)
+        self.assertNotEqual(
+            tasks.Board(tasks.ROOK, 'a4', enemies=['c2']).zobrist,
+            board.zobrist)
+
+    def test_big_boards(self):
+        board = tasks.Board(tasks.KING, 'a1', enemies=['sq300'],
+                            width=512, height=512)
+
+        self.check_hash(board)
+
+    def test_paths_are_shared(self):
+        for search in [tasks.BFS, tasks.DFS, tasks.ASTAR]:
+            first = tasks.Board(tasks.KNIGHT, 'a1', enemies=['h8', 'c2'],
+                                search=search)
+            second = tasks.Board(tasks.KNIGHT, 'a1', enemies=['h8', 'c2'],
+                                 search=search, stats=tasks.SearchStats())
+
+            path = first.get_shortest_path((A, ONE), (H, EIGHT))
+
+            self.assertEqual(second.get_shortest_path((A, ONE), (H, EIGHT)),
+                             path)
+            self.assertEqual(second.stats.counters['transposition_hits'], 1)
+            self.assertEqual(second.stats.counters['searches'], 0)
+
+    def test_collect_after_captures(self):
+        enemies = ['g4', 'h5', 'a1', 'b2']
+        first = tasks.Board(tasks.KING, 'h2', enemies=enemies,
+                            search=tasks.ASTAR)
+        second = tasks.Board(tasks.KING, 'h2', enemies=enemies,
+                             search=tasks.ASTAR, stats=tasks.SearchStats())
+
+        legs = first.get_fewest_moves_to_all_targets()
+
+        self.assertEqual(second.get_fewest_moves_to_all_targets(), legs)
+        self.assertEqual(second.stats.counters['searches'], 0)
+        self.assertTrue(second.stats.counters['transposition_hits'] >= 4)
+
+
+class TestStreamingLegs(unittest.TestCase):
+    targets = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+
+    def test_legs_match_the_tour(self):
+        for exact in [False, True]:
+            board = tasks.Board(tasks.KNIGHT, 'h2', enemies=self.targets)
+            expected = tasks.Board(
+                tasks.KNIGHT, 'h2', enemies=self.targets
+            ).get_fewest_moves_to_all_targets(exact=exact)
+
+            legs = list(board.iter_legs(exact=exact))
+
+            self.assertEqual([leg.moves for leg in legs], expected)
+            self.assertEqual([leg.total for leg in legs],
+                             [sum(len(moves) for moves in expected[:idx + 1])
+                              for idx in range(len(expected))])
+            self.assertTrue(all(leg.optimal == exact for leg in legs))
+
+    def test_legs_are_found_one_at_a_time(self):
+        board = tasks.Board(tasks.QUEEN, 'd4', enemies=self.targets,
+                            stats=tasks.SearchStats())
+
+        legs = board.iter_legs()
+        self.assertEqual(board.stats.counters['searches'], 0)
+        first = next(legs)
+
+        self.assertEqual(board.stats.counters['searches'], 1)
+        self.assertEqual(first.total, len(first.moves))
+        self.assertEqual(len(list(legs)), 7)
+        self.assertEqual(board.stats.counters['searches'], 8)
+
+    def test_no_targets(self):
+        board = tasks.Board(tasks.ROOK, 'a1')
+
+        self.assertEqual(list(board.iter_legs()), [])
+
+    def test_stream_and_store_are_not_both_allowed(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'solutions.db')
+
+        output = subprocess.check_output(
+            [sys.executable, tasks.__file__.replace('.pyc', '.py'),
+             '--piece', tasks.QUEEN, '--position', 'd4', '--collect',
+             '--stream', '--store', path])
+
+        self.assertEqual(output, 'Choose stream or store but not both.\n')
+        self.assertFalse(os.path.exists(path))
+
+
+class TestBatchMode(unittest.TestCase):
+
+    def test_answer_lines(self):
+        lines = [
+            json.dumps({'id': 1, 'piece': tasks.KNIGHT, 'position': 'a1'}),
+            '',
+            json.dumps({'id': 2, 'query': tasks.TARGET, 'piece': tasks.ROOK,
+                        'position': 'a1', 'enemies': ['a4', 'b2']}),
+            'not json',
+            '[1, 2]',
+        ]
+
+        responses = [json.loads(line) for line in tasks.answer_lines(lines)]
+
+        self.assertEqual(len(responses), 4)
+        self.assertEqual(responses[0]['id'], 1)
+        self.assertItemsEqual(responses[0]['result'], ['b3', 'c2'])
+        self.assertEqual(responses[1],
+                         {'id': 2, 'result': ['a1', 'a2', 'b2']})
+        self.assertEqual(responses[2:], [
+            {'error': 'ValueError: not a JSON request'}] * 2)
+
+    def test_bad_requests_are_answered(self):
+        requests = [
+            {'query': tasks.COLLECT, 'piece': tasks.BISHOP,
+             'position': 'a1', 'enemies': ['a2', 'b2']},
+            {'query': tasks.TARGET, 'piece': tasks.PAWN, 'position': 'c8'},
+            {'query': tasks.TARGET, 'piece': tasks.ROOK, 'position': 'a1',
+             'enemy_count': 0},
+            {'query': tasks.TARGET, 'piece': 'rook', 'position': 'a1'},
+            {'piece': tasks.ROOK, 'position': 'a1', 'enemies': 5},
+            {'id': 5, 'piece': tasks.KNIGHT, 'position': 'a1'},
+        ]
+        lines = [json.dumps(request) for request in requests]
+
+        responses = [json.loads(line) for line in tasks.answer_lines(lines)]
+
+        self.assertEqual(len(responses), 6)
+        self.assertEqual(responses[0], {
+            'error': 'NoPathToTargetError: Not every target can be reached.'})
+        self.assertEqual(responses[1:3], [{'result': []}] * 2)
+        self.assertTrue(responses[3]['error'].startswith(
+            'ValueError: rook is not a piece'))
+        self.assertTrue(responses[4]['error'].startswith('TypeError'))
+        self.assertItemsEqual(responses[5]['result'], ['b3', 'c2'])
+
+    def test_answer_lines_with_cache(self):
+        cache = tasks.SymmetryCache()
+        lines = [json.dumps({'piece': tasks.KNIGHT, 'position': position})
+                 for position in ['a1', 'h8', 'a8']]
+
+        responses = list(tasks.answer_lines(lines, cache))
+
+        self.assertEqual(len(responses), 3)
+        self.assertEqual(cache.stats()['hits'], 2)
+
+    def test_command_line(self):
+        requests = ''.join(
+            json.dumps({'id': idx, 'query': tasks.TARGET,
+                        'piece': tasks.QUEEN, 'position': 'h2',
+                        'enemies': ['g4', 'h5', 'a1']}) + '\n'
+            for idx in range(3))
+        process = subprocess.Popen(
+            [sys.executable, tasks.__file__.replace('.pyc', '.py'),
+             '--batch'], stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+        output, _ = process.communicate(requests)
+
+        responses = [json.loads(line) for line in output.splitlines()]
+        self.assertEqual([response['id'] for response in responses],
+                         [0, 1, 2])
+        self.assertEqual(responses[0]['result'], tasks.solve(
+            tasks.TARGET, tasks.QUEEN, 'h2', ['g4', 'h5', 'a1']))
+
+
+class TestConcurrentQueries(unittest.TestCase):
+    targets = ['g4', 'h5', 'a1', 'b2', 'b4', 'e6', 'h1', 'a8']
+
+    def get_state(self, board):
+        return (board.col, board.row, board.enemy_bits, board.occupied_bits,
+                board.zobrist, board.best, board.deadline)
+
+    def run_threads(self, func, count=8):
+        results = [None] * count
+
+        def run(idx):
+            results[idx] = func()
+
+        threads = [threading.Thread(target=run, args=(idx,))
+                   for idx in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_queries_leave_the_board_alone(self):
+        board = tasks.Board(tasks.KNIGHT, 'h2', enemies=self.targets,
+                            search=tasks.DFS)
+        state = self.get_state(board)
+        target = board.get_fewest_moves_to_farthest_target()
+
+        board.get_fewest_moves_to_all_targets()
+        legs = board.iter_legs()
+        next(legs)
+
+        self.assertEqual(self.get_state(board), state)
+        self.assertEqual(board.get_fewest_moves_to_farthest_target(),
+                         target)
+
+    def test_interleaved_tours(self):
+        board = tasks.Board(tasks.QUEEN, 'd4', enemies=self.targets)
+        expected = board.get_fewest_moves_to_all_targets()
+
+        first, second = board.iter_legs(), board.iter_legs()
+        legs = [(a.moves, b.moves) for a, b in zip(first, second)]
+
+        self.assertEqual([a for a, _ in legs], expected)
+        self.assertEqual([b for _, b in legs], expected)
+
+    def test_one_board_many_threads(self):
+        for search in [tasks.BFS, tasks.DFS, tasks.ASTAR]:
+            board = tasks.Board(tasks.KNIGHT, 'h2', enemies=self.targets,
+                                search=search)
+            state = self.get_state(board)
+            expected = (board.get_fewest_moves_to_all_targets(),
+                        board.get_fewest_moves_to_farthest_target(),
+                        board.get_available_moves())
+            tasks.TRANSPOSITIONS.clear()
+
+            results = self.run_threads(lambda: (
+                board.get_fewest_moves_to_all_targets(),
+                board.get_fewest_moves_to_farthest_target(),
+                board.get_available_moves()))
+
+            self.assertEqual(results, [expected] * 8)
+            self.assertEqual(self.get_state(board), state)
+
+    def test_shared_cache(self):
+        cache = tasks.LRUCache(50)
+
+        def hammer():
+            for idx in range(2000):
+                cache[idx % 80] = idx
+                cache.get((idx * 7) % 80)
+            return True
+
+        self.assertEqual(self.run_threads(hammer), [True] * 8)
+        links, link = 0, cache.root[1]
+        while link is not cache.root:
+            links += 1
+            link = link[1]
+        self.assertEqual(links, len(cache))
+        self.assertEqual(len(cache), 50)
+
+    def test_solve_from_threads(self):
+        cache = tasks.SymmetryCache()
+        query = (tasks.COLLECT, tasks.ROOK, 'a1', self.targets)
+        expected = tasks.solve(*query, cache=cache)
+
+        results = self.run_threads(lambda: tasks.solve(*query, cache=cache))
+
+        self.assertEqual(results, [expected] * 8)